@@ -8,41 +8,27 @@ import numpy as np
 import pandas as pd
 import geopandas as gpd
 from netCDF4 import num2date, Dataset
-import shapefile as shp
-import math
-
-
-def graticuleExtent(shp_out, extent, dx, dy):
-
-    minx,maxx,miny,maxy = extent
-    nx = int(math.ceil(abs(maxx - minx)/dx))
-    ny = int(math.ceil(abs(maxy - miny)/dy))
-    w = shp.Writer(shp_out, shp.POLYGON)
-    w.autoBalance = 1
-    w.field("ID")
-    id=0
-    
-    for j in range(nx):
-        for i in range(ny):
-            id+=1
-            vertices = []
-            parts = []
-            vertices.append([min(minx+dx*j,maxx),max(maxy-dy*i,miny)])
-            vertices.append([min(minx+dx*(j+1),maxx),max(maxy-dy*i,miny)])
-            vertices.append([min(minx+dx*(j+1),maxx),max(maxy-dy*(i+1),miny)])
-            vertices.append([min(minx+dx*j,maxx),max(maxy-dy*(i+1),miny)])
-            parts.append(vertices)
-            w.poly(parts)
-            w.record(id)
-    w.close()
-    
-    # Save a projection file (filename.prj)
-    prj = open("%s.prj" % shp_out, "w") 
-    epsg = 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]' 
-    prj.write(epsg)
-    prj.close()
-    
-    print('%s.shp is saved.' % shp_out)
+import gridWeights as gw
+import cubeReader as cr
+import gridMeta as gm
+import nmmeEnsemble as ne
+
+
+def graticuleExtent(out_fn, extent, dx, dy):
+    '''
+    Returns the grid definition (affine transform and shape) of a regular 
+    lon/lat grid over extent [minx, maxx, miny, maxy]. If out_fn is given, the
+    vector grid (ID from 1 in column-major order) is also saved as GeoParquet
+    (.parquet) or FlatGeobuf with a spatial index (otherwise).
+    '''
+    if out_fn is not None:
+        grid = gw.graticule(extent, dx, dy)
+        if out_fn.endswith('.parquet'):
+            grid.to_parquet(out_fn)
+        else:
+            grid.to_file(out_fn, driver='FlatGeobuf', SPATIAL_INDEX='YES')
+        print('%s is saved.' % out_fn)
+    return gw.gridFromExtent(extent, dx, dy)
 
 
 
@@ -58,56 +44,43 @@ tim = pd.date_range('1981-01-01', periods=len(tim), freq='M')
 extent = [lon[0]-dx/2, lon[-1]+dx/2, lat[-1]-dy/2, lat[0]+dy/2]
 
 # Creat a vector grid using latitidue and longitude
-# https://gis.stackexchange.com/questions/54119/creating-square-grid-polygon-shapefile-with-python
-graticuleExtent('./shp/grid_pisco', extent, dx, dy)
+gridDef = graticuleExtent('./shp/grid_pisco.fgb', extent, dx, dy)
+assert gridDef['shape'] == (len(lat), len(lon))
 
 # Intersect with administrative units
-# This is manually done in QGIS
-
-# Reproject to UTM zone 18S
-grid_dist = gpd.read_file('./shp/grid_pisco_dist.shp')
-grid_dist = grid_dist.to_crs({'init': 'epsg:32718'})    # UTM zone 18S
-# Caculate areas of all split polygons
-grid_dist["area_km2"] = grid_dist['geometry'].area / 10**6
-# Save GeoDataFrame to Shapefile
-grid_dist.to_file('./shp/grid_pisco_dist_area.shp')
+# *Each district is clipped against the grids in its bounding box, and areas
+#  of split polygons are exact on the WGS84 ellipsoid (no QGIS step, and no 
+#  distortion of UTM zone 18S across Peru).
+dist = gpd.read_file('/Users/dlee/data/per/land/admin_ign_idep/DISTRITOS.shp')
+grid = gw.gridIntersection(dist.to_crs(epsg=4326).geometry.values, 
+                           dist.IDDIST.values, gridDef, nproc=8)
+grid.to_csv('./shp/grid_pisco_dist_area.csv', index=False)
 
 
 #%% Spatial averages in administrative units
-grid = gpd.read_file('./shp/grid_pisco_dist_area.shp')
-prcp = np.array(nc.variables['variable'])
-ntim, nlat, nlon = prcp.shape
+# *The cube is read lazily in time chunks (no full copy or transpose); grid
+#  vectors are in Column-major order of the grid IDs.
+cube = cr.openCube(filn, 'variable')
+ntim, (nlat, nlon) = cube['ntim'], cube['shape']
 dim = [nlat, nlon]
-prcp = np.transpose(prcp, [0,2,1])
-prcp = np.reshape(prcp, [ntim, nlat*nlon])
 
-# Grids with no data (update "grid_pisco.shp")
-noval = (np.sum([prcp == prcp.min()], 1) == ntim)   # 6,717 grids
-temp = gpd.read_file('./shp/grid_pisco.shp')
-gid_noval = temp[noval.T].ID.astype(int)            # Grid ID has no value
-temp['noval'] = np.transpose(noval*1)               # 1 (no value)
-temp.to_file('./shp/grid_pisco.shp')        
+# Grids with no data
+# *The valid-cell mask (with the transform and cell areas) is computed once
+#  per product version by a streaming min/max over time and cached, so no 
+#  step rescans the record for no-value grids (6,717 grids).
+meta = gm.gridMeta(cube, 'PISCOpm', 'V2.1_beta')
+cr.setValid(cube, meta['valid'])
 
 # Spatial averages
-listID = np.unique(grid.IDDIST)
-nID = len(listID)
-prcp_dist = np.zeros([prcp.shape[0],nID])
-for i in range(nID):
-    nid = listID[i]
-    subID = grid[grid.IDDIST == nid].ID.astype(int) 
-    # Exclude no-value grids
-    rdx = np.in1d(subID, gid_noval)
-    subID = subID[~rdx]
-    # ID starts from 1 in Column-major order, so we subtract 1.
-    subID = subID - 1
-# =============================================================================
-#     subInd = np.unravel_index(subID.values.astype(int), dim, order='F')    
-#     subData = prcp[:,subInd[0],subInd[1]]
-# =============================================================================
-    subData = prcp[:, subID.values]
-    subArea = grid[grid.IDDIST == nid][~rdx].area_km2
-    prcp_dist[:,i] = (subData @ subArea)/subArea.sum()
-    
+# *The intersection is compiled once into a sparse (districts x grids) matrix
+#  of area weights (no-value grids excluded), so all districts of all months
+#  are averaged in one sparse matrix multiplication.
+# *Grid IDs (cell) are 0-based in Column-major order.
+listID, W = gw.weightMatrix(grid.zone, grid.cell, grid.area_km2,
+                            nlat*nlon, valid=meta['valid'])
+gw.saveWeights('./shp/weight_pisco_dist', listID, W)
+prcp_dist = cr.zonalMeanStream(cube, W)
+
 
 
 #%% Snippet of intersection
@@ -127,21 +100,15 @@ for i in range(nID):
 
 
 #%% NMME
-filn = '/Users/dlee/data/nmme/precip_mon_CCSM4_19930401_r1i1p1_199304-199403.nc'
-nc = Dataset(filn, 'r')
-prcp = np.array(nc.variables['PRECIP'])
-lat = np.array(nc.variables['LAT']); dy = 1.0
-lon = np.array(nc.variables['LON']) - 180; dx = 1.0
-# extent: [minx, maxx, miny, maxy]
-extent = [lon[0]-dx/2, lon[-1]+dx/2, lat[0]-dy/2, lat[-1]+dy/2]
-
-# Creat a vector grid using latitidue and longitude
-graticuleExtent('grid_nmme', extent, dx, dy)
-
-
-
-
-
-
-
-
+# *All models, initializations and members in the directory are found from 
+#  the file names (e.g., precip_mon_CCSM4_19930401_r1i1p1_199304-199403.nc).
+# *Members are averaged to districts with a 1-degree weight matrix compiled 
+#  once (cached), in a thread pool, and reduced to the ensemble mean, spread
+#  and tercile probabilities per district and lead month.
+files = ne.discoverFiles('/Users/dlee/data/nmme/')
+listID_nmme, Wn = ne.nmmeWeights('/Users/dlee/data/per/land/admin_ign_idep/DISTRITOS.shp',
+                                 'IDDIST', files.fn[0], './shp/weight_nmme_dist', nproc=8)
+prcp_nmme = ne.districtMembers(files.fn, Wn, nproc=8)
+outlook = ne.ensembleTable(prcp_nmme, files, listID_nmme)
+outlook.to_csv('./data/nmme_dist_outlook.csv', index=False)
+print('./data/nmme_dist_outlook.csv is saved.')
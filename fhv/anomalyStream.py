@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+'''
+Streaming standardized anomalies and extreme indices of daily PISCO.
+
+The (time, lat, lon) cube is read in time chunks (cubeReader) and never held
+in memory. The first pass sums seasonal totals of every period (e.g., JFM of
+each year) and merges chunk moments of wet-day rainfall in the base years
+with Welford (Chan) updates: count, mean, squared deviations, and mean of
+logarithms. The second pass counts days above a per-cell percentile of the
+wet-day gamma distribution (Thom's approximation from the streamed mean and
+mean-log). Standardized anomalies (z) and SPI-style indices (mixed gamma of
+totals with the probability of zero) are computed from the small (periods x
+cells) totals. Negative values and cells masked on the cube (gridMeta and
+cubeReader.setValid) are missing.
+
+The compact cube is saved as an indicator store (indicatorStore) with
+(periods, lat, lon) float32 zscore and spi, exceedance counts (exceed), the
+daily threshold, and a 0-1 'prec' hazard indicator (mean count of extreme
+days per period in the base years, scaled over valid cells).
+
+    - welfordMerge(state, block)
+    - gammaThom(mean, meanlog)
+    - streamMoments(cube, labels, ngroup, base, wet=1.0, chunk=None)
+    - exceedanceCount(cube, labels, ngroup, threshold, chunk=None)
+    - standardize(total, base)
+    - spiIndex(total, base)
+    - anomalyCube(cube, dates, path, months=(1,2,3), base=(1981, 2010),
+                  exclude=(1983, 1998), q=0.95, wet=1.0, chunk=None)
+'''
+import numpy as np
+from scipy import stats
+import cubeReader as cr
+import seasonalStats as ss
+import indicatorStore as store
+
+
+def _newState(ncell):
+    return {'n': np.zeros(ncell), 'mean': np.zeros(ncell),
+            'm2': np.zeros(ncell), 'lmean': np.zeros(ncell)}
+
+
+def welfordMerge(state, block):
+    '''
+    Merges moments of a (time x cells) block (NaN is missing) into the state
+    {n, mean, m2, lmean} of every cell (Chan's parallel Welford update). The
+    mean of logarithms (lmean) is for blocks of positive values only.
+    '''
+    valid = ~np.isnan(block)
+    nb = valid.sum(0).astype('float64')
+    ok = nb > 0
+    if not ok.any():
+        return state
+    x = np.where(valid, block, 0)
+    mb = np.zeros_like(nb); mb[ok] = x[:, ok].sum(0)/nb[ok]
+    m2b = np.where(valid, (block - mb)**2, 0).sum(0)
+    lb = np.zeros_like(nb)
+    lb[ok] = np.log(np.where(x > 0, x, 1))[:, ok].sum(0)/nb[ok]
+    n = state['n'] + nb
+    delta = np.zeros_like(nb); delta[ok] = mb[ok] - state['mean'][ok]
+    w = np.zeros_like(nb); w[ok] = nb[ok]/n[ok]
+    state['mean'] += delta*w
+    state['lmean'] += (lb - state['lmean'])*w
+    state['m2'] += m2b + delta**2*state['n']*w
+    state['n'] = n
+    return state
+
+
+def gammaThom(mean, meanlog):
+    '''
+    Shape and scale of gamma distributions from the mean and the mean of
+    logarithms (Thom's approximation); NaN where undefined
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        A = np.log(mean) - meanlog
+        shape = (1 + np.sqrt(1 + 4*A/3))/(4*A)
+        scale = mean/shape
+    bad = ~(np.isfinite(shape) & (shape > 0) & (scale > 0))
+    shape[bad] = np.nan; scale[bad] = np.nan
+    return shape, scale
+
+
+def _blockCells(block):
+    # (time, lat, lon) block as (time x cells) with missing values as NaN
+    block = block.reshape(block.shape[0], -1)
+    block[block < 0] = np.nan
+    return block
+
+
+def _colMajor(array, shape):
+    # (k x cells) row-major cells to column-major cell order
+    return array.reshape(-1, *shape).transpose(0,2,1).reshape(array.shape[0], -1)
+
+
+def streamMoments(cube, labels, ngroup, base, wet=1.0, chunk=None):
+    '''
+    First pass over the cube: totals and valid counts of periods, and Welford
+    moments of wet days (>= wet mm) of base periods.
+
+    labels - period of each time step (0, ..., ngroup-1); negative is excluded
+    base   - (ngroup,) boolean flag of base periods
+
+    Returns (ngroup x cells) total and count and the moment state (cells,),
+    in column-major cell order.
+    '''
+    labels = np.asarray(labels); base = np.asarray(base, dtype=bool)
+    ncell = np.prod(cube['shape'])
+    total = np.zeros((ngroup, ncell)); count = np.zeros((ngroup, ncell))
+    state = _newState(ncell)
+    for tslice, block in cr.iterChunks(cube, chunk):
+        block = _blockCells(block)
+        lab = labels[tslice]
+        for g in np.unique(lab[lab >= 0]):
+            sub = block[lab == g]
+            total[g] += np.nansum(sub, 0)
+            count[g] += np.sum(~np.isnan(sub), 0)
+        inbase = (lab >= 0) & base[np.maximum(lab, 0)]
+        if inbase.any():
+            sub = block[inbase]
+            welfordMerge(state, np.where(sub >= wet, sub, np.nan))
+    state = {key: _colMajor(value[None,:], cube['shape'])[0]
+             for key, value in state.items()}
+    return _colMajor(total, cube['shape']), _colMajor(count, cube['shape']), state
+
+
+def exceedanceCount(cube, labels, ngroup, threshold, chunk=None):
+    '''
+    Second pass over the cube: counts of days above a per-cell threshold
+    ((cells,) in column-major order) in every period, as (ngroup x cells)
+    '''
+    labels = np.asarray(labels)
+    nlat, nlon = cube['shape']
+    thsd = np.asarray(threshold).reshape(nlon, nlat).T.ravel()
+    thsd = np.where(np.isnan(thsd), np.inf, thsd)
+    out = np.zeros((ngroup, nlat*nlon), dtype=np.int32)
+    for tslice, block in cr.iterChunks(cube, chunk):
+        block = _blockCells(block)
+        lab = labels[tslice]
+        for g in np.unique(lab[lab >= 0]):
+            out[g] += (block[lab == g] > thsd).sum(0)
+    return _colMajor(out, cube['shape'])
+
+
+def standardize(total, base):
+    '''
+    Standardized anomalies (z) of (periods x cells) totals against the mean
+    and standard deviation (ddof=0, as stats.zscore) of base periods (Welford
+    over periods)
+    '''
+    state = _newState(total.shape[1])
+    for row in np.asarray(total)[np.asarray(base, dtype=bool)]:
+        welfordMerge(state, row[None,:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(state['m2']/state['n'])
+        return (total - state['mean'])/np.where(std > 0, std, np.nan)
+
+
+def spiIndex(total, base):
+    '''
+    SPI-style indices of (periods x cells) totals: a gamma distribution of
+    non-zero totals of base periods (Thom) mixed with the probability of zero,
+    transformed to the standard normal
+    '''
+    total = np.asarray(total, dtype='float64')
+    ref = total[np.asarray(base, dtype=bool)]
+    state = _newState(total.shape[1])
+    welfordMerge(state, np.where(ref > 0, ref, np.nan))
+    nref = (~np.isnan(ref)).sum(0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q0 = (ref == 0).sum(0)/nref
+    shape, scale = gammaThom(state['mean'], state['lmean'])
+    prob = q0 + (1 - q0)*stats.gamma.cdf(total, shape, scale=scale)
+    eps = 1e-6
+    return stats.norm.ppf(np.clip(prob, eps, 1 - eps))
+
+
+def anomalyCube(cube, dates, path, months=(1,2,3), base=(1981, 2010),
+                exclude=(1983, 1998), q=0.95, wet=1.0, chunk=None):
+    '''
+    Computes seasonal z-anomalies, SPI, and counts of extreme days (above the
+    q-th percentile of wet days) of every period and cell in two passes over
+    the cube, and saves them as a compact indicator store at path.
+
+    Returns the store as a dictionary.
+    '''
+    key, sel = ss.periodKeys(dates, months, 'year')
+    period = np.unique(key[sel])
+    labels = np.where(sel, np.searchsorted(period, key), -1)
+    inbase = (period >= base[0]) & (period <= base[1]) & ~np.isin(period, exclude)
+    total, count, state = streamMoments(cube, labels, len(period), inbase, wet, chunk)
+    valid = count.sum(0) > 0
+    total[:, ~valid] = np.nan
+    shape, scale = gammaThom(state['mean'], state['lmean'])
+    threshold = stats.gamma.ppf(q, shape, scale=scale)
+    exceed = exceedanceCount(cube, labels, len(period), threshold, chunk)
+    zscore = standardize(total, inbase)
+    spi = spiIndex(total, inbase)
+    spi[:, ~valid] = np.nan
+    # Hazard indicator: mean count of extreme days per base period (0-1)
+    freq = exceed[inbase].mean(0)
+    prec = np.full(freq.shape, np.nan)
+    prec[valid] = (freq[valid] - freq[valid].min())/np.ptp(freq[valid])
+    # Column-major cell vectors to (lat, lon) grids
+    nlat, nlon = cube['shape']
+    grid = lambda array: np.asarray(array).reshape(-1, nlon, nlat).transpose(0,2,1)
+    data = {'period': period,
+            'zscore': grid(zscore).astype('float32'),
+            'spi': grid(spi).astype('float32'),
+            'exceed': grid(exceed),
+            'threshold': grid(threshold)[0].astype('float32'),
+            'prec': grid(prec)[0].astype('float32')}
+    store.saveStore(path, data, mask=grid(valid)[0])
+    return data
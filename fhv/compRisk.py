@@ -5,26 +5,76 @@ import numpy as np
 import pandas as pd
 import geopandas as gpd
 import rasterio
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+import rasterIO as rio
+import gridAlign as ga
+import floodRisk as fr
+import zonalStats as zs
+import depthDamage as dd
+import facilityExposure as fe
+
+
+#%% Load district IDs, population, and flood depth on the 30s district grid
+fn = os.path.join('data', 'distid_30s.tif')
+did = rio.readRaster(fn).astype('int64')
+grid = ga.gridFromRaster(fn)
+popu = ga.alignRaster(os.path.join('data', 'popu_admin_landscan17.tif'), grid,
+                      dtype='float64', nodata=0)
+depth = ga.alignRaster(os.path.join('hydro', 'glofris_inun_rp_00010.tif'), grid,
+                       dtype='float64', nodata=0)
+
+
+#%% Flood risk by administrative units (District-Province-Department)
+# *Affected population is assumed to increase linearly with water level until
+#  2 meters (GLOFRIS inundation depth in meters).
+thsd = 2
+popuAfft = dd.affectedMaps(depth, {'popu': (popu, thsd)})['popu']
+# *Damage fraction of land cover with JRC depth-damage curves per ESA CCI class
+lcov = ga.alignRaster(os.path.join('data', 'aligned', 'raw', 'landcover_peru.tif'),
+                      grid)
+dmgr = dd.damageRatioByClass(depth, lcov, dd.landCoverCurves())
+# - Districts (IDDIST) in one pass, and rolled up to provinces and departments
+riskDist = zs.zonalStats(did, {'popu': popu, 'popuAfft': popuAfft, 
+                               'depth': np.where(depth > 0, depth, np.nan),
+                               'dmgr': np.where(depth > 0, dmgr, np.nan)},
+                         weights=popu, nodata=0)
+riskProv = zs.aggregateZones(riskDist, 100)
+riskDept = zs.aggregateZones(riskDist, 10000)
+riskDist.to_csv(os.path.join('data', 'risk_district.csv'))
+riskProv.to_csv(os.path.join('data', 'risk_province.csv'))
+riskDept.to_csv(os.path.join('data', 'risk_department.csv'))
+print('Affected population:\t{:>10,d} ({:.1f}%)'.format(
+    int(riskDist.popuAfft_sum.sum()), 
+    riskDist.popuAfft_sum.sum()/riskDist.popu_sum.sum()*100))
+
+
+#%% Affected health facilities (GeoMINSA) sampled from the flood depth raster
+facIdx = fe.facilityIndex(fe.MINSA_FN, grid)
+faclDepth = fe.sampleDepth(depth, facIdx)
+faclAfft = fe.affectedFacilities(depth, facIdx, thsd)
+print('Affected facilities:\t{:>10.1f} ({:d} facilities, {:d} flooded)'.format(
+    faclAfft, len(faclDepth), int(np.sum(faclDepth > 0))))
+
+
+#%% Flood risk of all return periods and expected annual impact (EAI)
+# *Depths of all GLOFRIS return periods are one (rps x rows x cols) stack, so
+#  affected population by districts and affected facilities of every return
+#  period are computed in one pass and integrated over the annual exceedance
+#  probability.
+rps = fr.RETURN_PERIODS
+stack = ga.alignStack([os.path.join('hydro', 'glofris_inun_rp_%05d.tif' % rp) 
+                       for rp in rps], grid, dtype='float32', nodata=0)
+inside = np.flatnonzero(did.ravel() > 0)
+depthV = stack.reshape(len(rps), -1)[:,inside]
+distIds, Z = fr.zoneMatrix(did.ravel()[inside])
+popuAfftRp = fr.affectedByReturnPeriod(depthV, popu.ravel()[inside], thsd, Z)
+faclAfftRp = fe.affectedFacilities(stack, facIdx, thsd)
+# - Districts (IDDIST), rolled up to provinces and departments
+riskRpDist = fr.riskTable({'popuAfft': popuAfftRp}, rps, distIds)
+riskRpProv = zs.aggregateZones(riskRpDist, 100)
+riskRpDept = zs.aggregateZones(riskRpDist, 10000)
+riskRpDist.to_csv(os.path.join('data', 'risk_rp_district.csv'))
+riskRpProv.to_csv(os.path.join('data', 'risk_rp_province.csv'))
+riskRpDept.to_csv(os.path.join('data', 'risk_rp_department.csv'))
+riskNat = fr.riskTable({'popuAfft': popuAfftRp.sum(1), 'faclAfft': faclAfftRp}, rps)
+print('EAI population:\t{:>10,.0f}'.format(riskNat.popuAfft_EAI.iloc[0]))
+print('EAI facilities:\t{:>10.1f}'.format(riskNat.faclAfft_EAI.iloc[0]))
@@ -6,18 +6,26 @@ author: Donghoon Lee / dlee298@wisc.edu
 """
 import os
 import numpy as np
-import gdal
-import fh
+import rasterIO as rio
+import indicatorStore as store
+import maskedGrid as mg
+import compositeIndex as ci
+import sensitivity as sa
+import zonalStats as zs
+import gridAlign as ga
+import floodRisk as fr
+import depthDamage as dd
+import facilityExposure as fe
 import pandas as pd
 
-# Load Census indicators
-cens = np.load('data_census.npy'); cens = cens.item()
+# Load Census indicators (in-country cells only)
+cens = store.loadLayers('data_census', masked=True)
 hous, elec, watr, sani = cens['hous'], cens['elec'], cens['watr'], cens['sani']
 resi, depd, disa, edul = cens['resi'], cens['depd'], cens['disa'], cens['edul']
 empl, occu, litr = cens['empl'], cens['occu'], cens['litr']
 ypop, opop, vpop = cens['ypop'], cens['opop'], cens['vpop']
-# Load Other indicators
-indc = np.load('data_indices.npy'); indc = indc.item()
+# Load Other indicators (in-country cells only)
+indc = store.loadLayers('data_indices', masked=True)
 priv, pcsh, ncsh, nhsp = indc['priv'], indc['pcsh'], indc['ncsh'], indc['nhsp']
 nphc, slop, prec, tavg = indc['nphc'], indc['slop'], indc['prec'], indc['tavg']
 wind, elev, wlth, povt = indc['wind'], indc['elev'], indc['wlth'], indc['povt']
@@ -25,11 +33,15 @@ incm, gdp, fpro, tphc = indc['incm'], indc['gdp'], indc['fpro'], indc['tphc']
 aphc, thsp, ahsp, fdep = indc['aphc'], indc['thsp'], indc['ahsp'], indc['fdep']
 # Load code4 and code3
 fn = os.path.join('land', 'boundary_gadm', 'gadm4_code.tif')
-ds = gdal.Open(fn); dsCopy = ds
-code4 = ds.GetRasterBand(1).ReadAsArray()
+code4 = rio.readRaster(fn); meta = rio.readMeta(fn)
 code3 = np.floor(code4/100)
 nc = (code4 == code4[0,0])      # No-code
 yc = (code4 != code4[0,0])      # Yes-code
+ycg = mg.maskIndex(yc)          # Yes-code cells (vectors are over these cells)
+# - Masked vectors of the stores must be over the same Yes-code cells
+for path in ['data_census', 'data_indices']:
+    assert np.array_equal(store.loadMask(path), yc), \
+        '%s is not masked by the Yes-code cells; rebuild the store.' % path
 
 
 #%% Flood-Health Vulnerability (FHV)
@@ -49,107 +61,67 @@ yc = (code4 != code4[0,0])      # Yes-code
 # - clim(320): prec(321), tavg(322), wind(323)
 #
 
-# Matrix of all indicators
+# Indicators by name, in the leaf order of the FHV tree (the weight sheet is
+# matched by name, so its row order does not matter)
+indicators = dict(cens, **indc)
+nameYF = ci.leafIndicators(ci.FHV_TREE, 'fhv')
+nameNF = [name for name in nameYF if name not in ['fdep','aphc','ahsp']]
+
+# Matrix of all indicators (indicators are vectors of Yes-code cells)
 # - Both static and dynamic indicators (33)
-dataYF = np.array([ypop[yc],opop[yc],vpop[yc],disa[yc],depd[yc],edul[yc],litr[yc],
-                 empl[yc],occu[yc],wlth[yc],povt[yc],incm[yc],sani[yc],watr[yc],
-                 nphc[yc],nhsp[yc],tphc[yc],thsp[yc],aphc[yc],ahsp[yc],fpro[yc],
-                 priv[yc],elev[yc],hous[yc],resi[yc],ncsh[yc],pcsh[yc],elec[yc],
-                 fdep[yc],slop[yc],prec[yc],tavg[yc],wind[yc]]).T
+dataYF = np.array([indicators[name] for name in nameYF], dtype='float32').T
 # - Only static indicators (30)
-dataNF= np.array([ypop[yc],opop[yc],vpop[yc],disa[yc],depd[yc],edul[yc],litr[yc],
-                 empl[yc],occu[yc],wlth[yc],povt[yc],incm[yc],sani[yc],watr[yc],
-                 nphc[yc],nhsp[yc],tphc[yc],thsp[yc],fpro[yc],
-                 priv[yc],elev[yc],hous[yc],resi[yc],ncsh[yc],pcsh[yc],elec[yc],
-                 slop[yc],prec[yc],tavg[yc],wind[yc]]).T
+dataNF = np.array([indicators[name] for name in nameNF], dtype='float32').T
 
 # Load initial weights
 fn = os.path.join('initial_weights.xlsx')
 xl = pd.ExcelFile(fn); df = xl.parse('weight')
-name = df.name
-weightYF = df.weight
-weightNF = df[~name.isin(['fdep','aphc','ahsp'])].weight
+weight = df.set_index('name').weight
+weightYF = weight.reindex(nameYF)
+assert not weightYF.isnull().any(), '%s misses indicators.' % fn
+weightNF = weight.reindex(nameNF)
 weightNF = weightNF/weightNF.sum()       # scale to 1
 
-# Calculate FHV index
-fhvYF = fh.valueToMap(np.dot(dataYF, weightYF), yc)
-fhvNF = fh.valueToMap(np.dot(dataNF, weightNF), yc)
-
-# Sub-domains composite indicators (rescaled to 0-1)
-demo = np.dot(dataYF[:,:5], weightYF[:5])/weightYF[:5].sum()
-demo = fh.valueToMap(demo, yc)
-seco = np.dot(dataYF[:,5:12], weightYF[5:12])/weightYF[5:12].sum()
-seco = fh.valueToMap(seco, yc)
-heal = np.dot(dataYF[:,12:14], weightYF[12:14])/weightYF[12:14].sum()
-heal = fh.valueToMap(heal, yc)
-hsys = np.dot(dataYF[:,14:20], weightYF[14:20])/weightYF[14:20].sum()
-hsys = fh.valueToMap(hsys, yc)
-susc = np.dot(dataYF[:,:20], weightYF[:20])/weightYF[:20].sum()
-susc = fh.valueToMap(susc, yc)
-phys = np.dot(dataYF[:,20:25], weightYF[20:25])/weightYF[20:25].sum()
-phys = fh.valueToMap(phys, yc)
-cope = np.dot(dataYF[:,25:28], weightYF[25:28])/weightYF[25:28].sum()
-cope = fh.valueToMap(cope, yc)
-expo = np.dot(dataYF[:,20:28], weightYF[20:28])/weightYF[20:28].sum()
-expo = fh.valueToMap(expo, yc)
-hydr = np.dot(dataYF[:,28:30], weightYF[28:30])/weightYF[28:30].sum()
-hydr = fh.valueToMap(hydr, yc)
-clim = np.dot(dataYF[:,30:33], weightYF[30:33])/weightYF[30:33].sum()
-clim = fh.valueToMap(clim, yc)
-hazd = np.dot(dataYF[:,28:33], weightYF[28:33])/weightYF[28:33].sum()
-hazd = fh.valueToMap(hazd, yc)
+# FHV index and sub-domains composite indicators (rescaled to 0-1)
+# *All sub-domains are evaluated in one multiplication with a block-weight matrix
+nodes, W = ci.blockWeights(ci.FHV_TREE, nameYF, weightYF)
+comp = ci.evaluateComposite(dataYF, nodes, W)
+fhvYF = comp['fhv']
+demo, seco, heal, hsys = comp['demo'], comp['seco'], comp['heal'], comp['hsys']
+susc, phys, cope, expo = comp['susc'], comp['phys'], comp['cope'], comp['expo']
+hydr, clim, hazd = comp['hydr'], comp['clim'], comp['hazd']
+nodes, W = ci.blockWeights(ci.FHV_TREE, nameNF, weightNF, ['fhv'])
+fhvNF = ci.evaluateComposite(dataNF, nodes, W)['fhv']
 
 # Low and High FHV zone
-hzon = np.ones(code4.shape)*99; hzon[(fhvYF >= 0.6)] = 1
-lzon = np.ones(code4.shape)*99; lzon[(fhvYF < 0.4)] = 1
+hzon = np.where(fhvYF >= 0.6, 1, 99)
+lzon = np.where(fhvYF < 0.4, 1, 99)
 
 # Saving sub-domain composite indicators, FHV index, High FHV zone
-fn = os.path.join('result','demo.tif'); temp = demo; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','seco.tif'); temp = seco; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','heal.tif'); temp = heal; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','hsys.tif'); temp = hsys; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','susc.tif'); temp = susc; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','phys.tif'); temp = phys; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','cope.tif'); temp = cope; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','expo.tif'); temp = expo; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','hydr.tif'); temp = hydr; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','clim.tif'); temp = clim; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','hazd.tif'); temp = hazd; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','fhv.tif'); temp = fhvYF; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','hzon.tif'); temp = hzon
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Int16, 99); del out_ds
-fn = os.path.join('result','lzon.tif'); temp = lzon
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Int16, 99); del out_ds
+layers = {'demo':demo, 'seco':seco, 'heal':heal, 'hsys':hsys, 'susc':susc,
+          'phys':phys, 'cope':cope, 'expo':expo, 'hydr':hydr, 'clim':clim,
+          'hazd':hazd, 'fhv':fhvYF}
+mg.writeVectors({os.path.join('result', name+'.tif'): layers[name] 
+                 for name in layers}, ycg, meta, 'float32', -9999)
+mg.writeVectors({os.path.join('result','hzon.tif'): hzon,
+                 os.path.join('result','lzon.tif'): lzon}, ycg, meta, 'int16', 99)
 
 
 #%% Flood and Health Risk Assessment
 # Load flood depth
 loc = os.path.join('hydrology', 'inundation_glofris')
-ds = gdal.Open(os.path.join(loc, 'rp_00010.tif'))
-depth = ds.GetRasterBand(1).ReadAsArray().astype('float')    # (727,559)
+depth = rio.readRaster(os.path.join(loc, 'rp_00010.tif'), dtype='float')  # (727,559)
 depth[nc] = 0
 # Load population (LandScan, 2015)
 fn = os.path.join('socioecon', 'population_landscan', 'lspop_bgd.tif')
-ds = gdal.Open(fn)
-popu = ds.GetRasterBand(1).ReadAsArray()
+popu = rio.readRaster(fn)
 popu[(popu == popu.min()) | nc] = 0
 # - 2015 population from World Bank
 popu2015 = 161200886
 # - Scale LandScan population to World Bank Population
 popu = popu/popu.sum()*popu2015
 popuTotl = popu.sum()
+popuV = mg.toVector(popu, ycg, 'float64')
 # =============================================================================
 # # Load GDP(PPP) (Kummu et la., 2017)
 # fn = os.path.join('socioecon', 'gdp_kummu', 'gdp_ppp_2015_30s_bgd.tif')
@@ -165,131 +137,146 @@ gdp = gdp * 3132.57
 
 
 # 1. Flood Risk Assessment (FRA) -------------------------------------------- #
-# (1) Affected Population
+# (1) Affected Population and GDP (in one pass over depths)
 # *Affected population is assumed to increase linearly with water level until
 #  2 meters.
-thsd = 20
-ratio = depth.copy()
-ratio[ratio <= thsd] = ratio[ratio <= thsd]/thsd
-ratio[ratio > thsd] = 1
-popuAfft = np.sum(ratio*popu)
-
-# (2) High-FHA and Low-FHA population
-popuHzon = popu[fhvYF >= 0.60].sum()
-popuLzon = popu[fhvYF < 0.40].sum()
-popuMode = popu[(0.40<=fhvYF) & (fhvYF < 0.6)].sum()
-
-# (3) Affected GDP
 # *Affected GDP is assumed to increase linearly with water level from a damage
 #  of zero for a water level of zero, to a maximum affected GDP at a water 
 #  level of 3 meter.
-thsd = 30
-ratio = depth.copy()
-ratio[ratio <= thsd] = ratio[ratio <= thsd]/thsd
-ratio[ratio > thsd] = 1
-gdpAfft = np.sum(ratio*gdp)
+afft = dd.affectedMaps(depth, {'popu': (popu, 20), 'gdp': (gdp, 30)})
+popuAfftMap, gdpAfftMap = afft['popu'], afft['gdp']
+popuAfft = np.sum(popuAfftMap)
+gdpAfft = np.sum(gdpAfftMap)
+
+# (2) High-FHA and Low-FHA population
+popuHzon = popuV[fhvYF >= 0.60].sum()
+popuLzon = popuV[fhvYF < 0.40].sum()
+popuMode = popuV[(0.40<=fhvYF) & (fhvYF < 0.6)].sum()
+
+# (3) Flood risk by Upazila (code3)
+# *All Upazilas in one pass (sums, means, and population-weighted means)
+zone = mg.toVector(code3, ycg, 'int64')
+riskUpz = zs.zonalStats(zone, {'popu': popuV,
+                               'popuAfft': mg.toVector(popuAfftMap, ycg, 'float64'),
+                               'popuHzon': popuV*(fhvYF >= 0.6),
+                               'gdpAfft': mg.toVector(gdpAfftMap, ycg, 'float64'),
+                               'fhv': fhvYF}, weights=popuV)
+riskUpz.to_csv(os.path.join('result', 'risk_upazila.csv'))
+
+# (4) Flood risk of all return periods and expected annual impact (EAI)
+# *Depths of all return periods are one memory-mapped (rps x rows x cols) 
+#  stack, so affected population, GDP, and facilities of every return period
+#  are computed in one pass and integrated over the exceedance probability.
+rps = fr.RETURN_PERIODS
+grid = ga.gridFromRaster(os.path.join('land', 'boundary_gadm', 'gadm4_code.tif'))
+stack = ga.alignStack([os.path.join(loc, 'rp_%05d.tif' % rp) for rp in rps], 
+                      grid, dtype='float32', nodata=0)
+depthV = stack.reshape(len(rps), -1)[:,ycg['index']]
+gdpV = mg.toVector(gdp, ycg, 'float64')
+upzIds, Z = fr.zoneMatrix(zone)
+popuAfftRp = fr.affectedByReturnPeriod(depthV, popuV, 20, Z)
+gdpAfftRp = fr.affectedByReturnPeriod(depthV, gdpV, 30, Z)
+riskRp = fr.riskTable({'popuAfft': popuAfftRp, 'gdpAfft': gdpAfftRp}, rps, upzIds)
+riskRp.to_csv(os.path.join('result', 'risk_returnperiod_upazila.csv'))
+# - Facilities (PHC and Hospital) sampled from the depth stack at their cells
+#   (out-of-country cells have no flood depth, as depth[nc] = 0 above)
+fn = os.path.join('health', 'healthsites_lged', '%s_rp00010.shp')
+facIdx = {name: fe.facilityIndex(fn % name, grid) for name in ['family', 'hospital']}
+facAfftRp = {name: fe.affectedFacilities(stack, facIdx[name], 15, mask=nc) 
+             for name in facIdx}
+riskNat = fr.riskTable({'popuAfft': popuAfftRp.sum(1), 
+                        'gdpAfft': gdpAfftRp.sum(1),
+                        'phcAfft': facAfftRp['family'], 
+                        'hspAfft': facAfftRp['hospital']}, rps)
+print('Expected annual affected population: {:,.0f}'.format(riskNat['popuAfft_EAI'][0]))
+print('Expected annual affected GDP: ${:,.0f}'.format(riskNat['gdpAfft_EAI'][0]))
+print('Expected annual affected PHC: {:,.1f}'.format(riskNat['phcAfft_EAI'][0]))
+print('Expected annual affected Hospitals: {:,.1f}'.format(riskNat['hspAfft_EAI'][0]))
 
 
 # 2. Health Risk Assessment (HRA) ------------------------------------------- #
 # (1) Number of affected hospitals and PHC
-import geopandas
+# *Depths are sampled from the flood depth raster at facility cells
 thsd = 15
 # - PHC
-fn = os.path.join('health', 'healthsites_lged', 'family_rp00010.shp')
-gdf = geopandas.read_file(fn)
-phcDepth = gdf.rp_00010.values; nphc = len(phcDepth)
-phcDepth = phcDepth[~np.isnan(phcDepth)]
-phcDepth[phcDepth < thsd] = phcDepth[phcDepth < thsd]/thsd
-phcDepth[phcDepth >= thsd] = 1
-phcAfft = phcDepth.sum()
+phcDepth = fe.sampleDepth(depth, facIdx['family']); nphc = len(phcDepth)
+phcAfft = dd.affectedCount(phcDepth, thsd)
 # - Hospital
-fn = os.path.join('health', 'healthsites_lged', 'hospital_rp00010.shp')
-gdf = geopandas.read_file(fn)
-hspDepth = gdf.rp_00010.values; nhsp = len(hspDepth)
-hspDepth = hspDepth[~np.isnan(hspDepth)]
-hspDepth[hspDepth < thsd] = hspDepth[hspDepth < thsd]/thsd
-hspDepth[hspDepth >= thsd] = 1
-hspAfft = hspDepth.sum() 
+hspDepth = fe.sampleDepth(depth, facIdx['hospital']); nhsp = len(hspDepth)
+hspAfft = dd.affectedCount(hspDepth, thsd) 
 
 # (2) Population with affected travel time to Hospitals and PHC
 thsdAtt = 60
 # - PHC
-ds = gdal.Open(os.path.join('health', 'traveltime_lged', 'aphc.tif'))
-phcAtt = ds.GetRasterBand(1).ReadAsArray().astype('float')
+phcAtt = rio.readRaster(os.path.join('health', 'traveltime_lged', 'aphc.tif'),
+                        dtype='float')
 phcAtt[nc | (phcAtt < 0)]= 0
 popuAttPhc = popu[phcAtt >= thsdAtt].sum()
 # - Hospital
-ds = gdal.Open(os.path.join('health', 'traveltime_lged', 'ahsp.tif'))
-hspAtt = ds.GetRasterBand(1).ReadAsArray().astype('float')
+hspAtt = rio.readRaster(os.path.join('health', 'traveltime_lged', 'ahsp.tif'),
+                        dtype='float')
 hspAtt[nc | (hspAtt < 0)]= 0
 popuAttHsp = popu[hspAtt >= thsdAtt].sum()
 
 # Sensitivity analysis
+# *Frequencies of FHV in 20 bins (0.05) with random weights. Runs are sharded
+#  into chunks, resumed from checkpoints, and cached by the hash of the
+#  indicators and the configuration in "data_sensitivity".
 fn = 'data_sensitivity'
 ntrial = 5000                         # Number of trials
-if not os.path.isfile(fn+'.npz'):
-    
-    freqYF = np.zeros([yc.sum(), 20]).astype('int16')
-    freqNF = np.zeros([yc.sum(), 20]).astype('int16')
-    for i in range(ntrial):
-        # Generate random weights
-        rweightYF = np.random.random([dataYF.shape[1], 1])
-        rweightYF = rweightYF/rweightYF.sum()
-        outputYF = np.dot(dataYF,rweightYF)
-        rweightNF = np.random.random([dataNF.shape[1], 1])
-        rweightNF = rweightNF/rweightNF.sum()
-        outputNF = np.dot(dataNF,rweightNF)
-        # Store frequencies
-        for j in range(20):
-            cid_yf, _ = np.where((j/20 <= outputYF) & (outputYF < (j+1)/20))
-            freqYF[cid_yf,j] = freqYF[cid_yf,j] + 1
-            cid_nf, _ = np.where((j/20 <= outputNF) & (outputNF < (j+1)/20))
-            freqNF[cid_nf,j] = freqNF[cid_nf,j] + 1
-        print('{}/{} ({:02.1f}%%)'.format(i+1,ntrial,(i+1)/ntrial*100))
-    
-    # Save result
-    np.savez(fn, freqYF=freqYF, freqNF=freqNF)
-    print('{}.npy is saved..'.format(fn))
+seed = 2019                           # Seed of random weights
+freqYF = sa.runSensitivity(dataYF, ntrial, fn, 20, seed)
+freqNF = sa.runSensitivity(dataNF, ntrial, fn, 20, seed+1)
 
+# Per-indicator attribution
+# - One-at-a-time perturbation (-50%, -25%, +25%, +50%) of initial weights
+oatChange, oatBin = sa.oatSensitivity(dataYF, weightYF.values)
+# - Sobol first-order and total-order indices (cached by the hash of the
+#   indicators and the configuration)
+nsample = 1024
+key = sa.runHash(dataYF, {'nsample': nsample, 'seed': seed})
+fn = os.path.join('data_sensitivity', 'sobol_%s.npz' % key)
+if not os.path.isfile(fn):
+    sobolS1, sobolST = sa.sobolIndices(dataYF, nsample, seed)
+    os.makedirs('data_sensitivity', exist_ok=True)
+    np.savez(fn, S1=sobolS1, ST=sobolST)
+    print('%s is saved.' % fn)
 else:
-    # Load result
-    output = np.load(fn+'.npz')
-    freqYF, freqNF = output['freqYF'], output['freqNF']
+    output = np.load(fn)
+    sobolS1, sobolST = output['S1'], output['ST']
+attr = pd.DataFrame({'weight': weightYF.values,
+                     'oat_change': oatChange.mean(1),
+                     'oat_binchange': oatBin.mean(1),
+                     'sobol_S1': np.nanmean(sobolS1, 0),
+                     'sobol_ST': np.nanmean(sobolST, 0)}, index=nameYF)
+attr.to_csv(os.path.join('result', 'sensitivity_indicators.csv'))
 
 # Frequency of Low-FHV and High-FHV
-freqYFL = np.zeros(code4.shape)
-freqYFL[yc] = freqYF[:,:8].sum(1)/ntrial
-freqYFH = np.zeros(code4.shape)
-freqYFH[yc] = freqYF[:,12:].sum(1)/ntrial
-freqNFL = np.zeros(code4.shape)
-freqNFL[yc] = freqNF[:,:8].sum(1)/ntrial
-freqNFH = np.zeros(code4.shape)
-freqNFH[yc] = freqNF[:,12:].sum(1)/ntrial
+freqYFL = freqYF[:,:8].sum(1)/ntrial
+freqYFH = freqYF[:,12:].sum(1)/ntrial
+freqNFL = freqNF[:,:8].sum(1)/ntrial
+freqNFH = freqNF[:,12:].sum(1)/ntrial
 
 # Percentage of HZON outside or inside of predominantly vulnerable zone
 thsd = 0.7
-pdomHzonA = np.ones(code4.shape)*99; pdomHzonA[freqYFH >= thsd] = 1
-pdomHzonB = np.ones(code4.shape)*99; pdomHzonB[freqNFH >= thsd] = 1
+pdomHzonA = np.where(freqYFH >= thsd, 1, 99)
+pdomHzonB = np.where(freqNFH >= thsd, 1, 99)
 pdomHzonAreaA = np.sum(freqYFH >= thsd)/np.sum(yc)*100
 pdomHzonAreaB = np.sum(freqNFH >= thsd)/np.sum(yc)*100
-pdomHzonPopuA = np.sum(popu[freqYFH >= thsd])
-pdomHzonPopuB = np.sum(popu[freqNFH >= thsd])
+pdomHzonPopuA = np.sum(popuV[freqYFH >= thsd])
+pdomHzonPopuB = np.sum(popuV[freqNFH >= thsd])
 hzonInPdomA = np.sum((hzon == 1) & (freqYFH >= thsd))/np.sum(hzon == 1)
 hzonInPdomB = np.sum((hzon == 1) & (freqNFH >= thsd))/np.sum(hzon == 1)
 
 # Save maps
-fn = os.path.join('result','freqYFL.tif'); temp = freqYFL; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','freqYFH.tif'); temp = freqYFH; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','freqNFL.tif'); temp = freqNFL; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','freqNFH.tif'); temp = freqNFH; temp[nc] = -9999
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Float32, -9999); del out_ds
-fn = os.path.join('result','pdomHzonA.tif'); temp = pdomHzonA
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Int16, 99); del out_ds
-fn = os.path.join('result','pdomHzonB.tif'); temp = pdomHzonB
-out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Int16, 99); del out_ds
+mg.writeVectors({os.path.join('result','freqYFL.tif'): freqYFL,
+                 os.path.join('result','freqYFH.tif'): freqYFH,
+                 os.path.join('result','freqNFL.tif'): freqNFL,
+                 os.path.join('result','freqNFH.tif'): freqNFH}, 
+                ycg, meta, 'float32', -9999)
+mg.writeVectors({os.path.join('result','pdomHzonA.tif'): pdomHzonA,
+                 os.path.join('result','pdomHzonB.tif'): pdomHzonB}, 
+                ycg, meta, 'int16', 99)
 
 
 
@@ -297,18 +284,18 @@ out_ds = fh.make_raster(dsCopy, fn, temp, gdal.GDT_Int16, 99); del out_ds
 print('==================================================')
 print('VEH Layers and Risk')
 print('--------------------------------------------------')
-print('Susceptibility:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(susc[yc]), np.min(susc[yc])))
-print('- Demographic:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(demo[yc]), np.min(demo[yc])))
-print('- Socio-ecnominc:\tMax= {:.3f}, Min= {:.3f}'.format(np.max(seco[yc]), np.min(seco[yc])))
-print('- Heath:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(heal[yc]), np.min(heal[yc])))
-print('- Health system:\tMax= {:.3f}, Min= {:.3f}'.format(np.max(hsys[yc]), np.min(hsys[yc])))
-print('Exposure:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(expo[yc]), np.min(expo[yc])))
-print('- Physical exposure:\tMax= {:.3f}, Min= {:.3f}'.format(np.max(phys[yc]), np.min(phys[yc])))
-print('- Coping capacity:\tMax= {:.3f}, Min= {:.3f}'.format(np.max(cope[yc]), np.min(cope[yc])))
-print('Hazard:\t\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(hazd[yc]), np.min(hazd[yc])))
-print('- Hydrologic:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(hydr[yc]), np.min(hydr[yc])))
-print('- Climatic:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(clim[yc]), np.min(clim[yc])))
-print('FHV:\t\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(fhvYF[yc]), np.min(fhvYF[yc])))
+print('Susceptibility:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(susc), np.min(susc)))
+print('- Demographic:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(demo), np.min(demo)))
+print('- Socio-ecnominc:\tMax= {:.3f}, Min= {:.3f}'.format(np.max(seco), np.min(seco)))
+print('- Heath:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(heal), np.min(heal)))
+print('- Health system:\tMax= {:.3f}, Min= {:.3f}'.format(np.max(hsys), np.min(hsys)))
+print('Exposure:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(expo), np.min(expo)))
+print('- Physical exposure:\tMax= {:.3f}, Min= {:.3f}'.format(np.max(phys), np.min(phys)))
+print('- Coping capacity:\tMax= {:.3f}, Min= {:.3f}'.format(np.max(cope), np.min(cope)))
+print('Hazard:\t\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(hazd), np.min(hazd)))
+print('- Hydrologic:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(hydr), np.min(hydr)))
+print('- Climatic:\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(clim), np.min(clim)))
+print('FHV:\t\t\tMax= {:.3f}, Min= {:.3f}'.format(np.max(fhvYF), np.min(fhvYF)))
 print('--------------------------------------------------')
 print('Flood Risk Assessment')
 print('--------------------------------------------------')
@@ -325,6 +312,7 @@ print('Popu in pdomHzon-A:\t{:>10,d} ({:.1f}%)'.format(int(pdomHzonPopuA), pdomH
 print('Popu in pdomHzon-B:\t{:>10,d} ({:.1f}%)'.format(int(pdomHzonPopuB), pdomHzonPopuB/popuTotl*100))
 print('Hzon in pdomHzon-A:\t{:.2f}%'.format(hzonInPdomA*100))
 print('Hzon in pdomHzon-B:\t{:.2f}%'.format(hzonInPdomB*100))
+print('Top-5 indicators (ST):\t{}'.format(', '.join(attr.sobol_ST.nlargest(5).index)))
 print('Affected GDP:\t\t${:>7,.1f} B'.format(gdpAfft/10**9))
 print('Affected GDP per capita:${:>7,.1f} ({:.1f}%)'.format(gdpAfft/popuTotl, (gdpAfft/popuTotl)/(gdp.sum()/popuTotl)*100))
 print('*GDP(PPP) per capita:\t${:>7,d}'.format(int(gdp.sum()/popuTotl)))
@@ -0,0 +1,30 @@
+#!/home/dlee/.virtualenvs/fh/bin/python
+# -*- coding: utf-8 -*-
+"""
+This script evaluates policy scenarios of Flood-Health Vulnerability (FHV) 
+and Risk in a batch, with inputs loaded once
+author: Donghoon Lee / dlee298@wisc.edu
+"""
+import os
+import scenarios as sc
+
+# Load inputs (indicators, flood depths of all return periods, population,
+# facilities, and travel times) once
+inputs = sc.loadInputs()
+
+# Scenarios: all combinations of thresholds, FHV zones, and return periods,
+# with and without flood-dependent indicators
+configs = sc.scenarioGrid(thsd=[10, 20, 30],
+                          thsdAtt=[30, 60, 120],
+                          zoneHigh=[0.5, 0.6, 0.7],
+                          rp=[10, 100, 1000],
+                          flood=[True, False])
+# - Doubled weight of each hazard indicator
+configs += [{'weights': {name: 2*inputs['weight'][sc.NAMES.index(name)]}}
+            for name in ['fdep','slop','prec','tavg','wind']]
+
+# Evaluate scenarios in parallel and save a single results table
+table = sc.runScenarios(inputs, configs, nthread=8)
+fn = os.path.join('result', 'scenarios.csv')
+table.to_csv(fn)
+print('%s is saved. (%d scenarios)' % (fn, len(table)))
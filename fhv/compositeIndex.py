@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+'''
+Hierarchical composite index evaluator.
+
+An index is defined as a tree of sub-domains whose leaves are indicators. The
+tree is compiled once into a sparse (indicators x sub-domains) block-weight
+matrix, each column holding the normalized weights of the indicators under a
+sub-domain, so that every sub-domain score is computed by a single matrix
+multiplication over the (cells x indicators) matrix.
+
+    - leafIndicators(tree, node)
+    - blockWeights(tree, names, weights, nodes=None)
+    - evaluateComposite(data, nodes, W)
+'''
+import numpy as np
+from scipy import sparse
+
+# Flood-Health Vulnerability (FHV)
+#
+# Susceptibility (100)
+# - demo(110): ypop(111), opop(112), vpop(113), disa(114), depd(115)
+# - seco(120): edul(121), litr(122), empl(123), occu(124), wlth(125), povt(126), incm(127)
+# - heal(130): sani(131), watr(132)
+# - hsys(140): nphc(141), nhsp(142), tphc(143), thsp(144), aphc(145), ahsp(146)
+#
+# Exposure (200)
+# - phys(210): fpro(211), priv(212), elev(213), hous(214), resi(215)
+# - cope(220): ncsh(221), pcsh(222), elec(223)
+#
+# Hazard(300)
+# - hydr(310): fdep(311), slop(312)
+# - clim(320): prec(321), tavg(322), wind(323)
+#
+FHV_TREE = {
+    'fhv': ['susc', 'expo', 'hazd'],
+    'susc': ['demo', 'seco', 'heal', 'hsys'],
+    'demo': ['ypop', 'opop', 'vpop', 'disa', 'depd'],
+    'seco': ['edul', 'litr', 'empl', 'occu', 'wlth', 'povt', 'incm'],
+    'heal': ['sani', 'watr'],
+    'hsys': ['nphc', 'nhsp', 'tphc', 'thsp', 'aphc', 'ahsp'],
+    'expo': ['phys', 'cope'],
+    'phys': ['fpro', 'priv', 'elev', 'hous', 'resi'],
+    'cope': ['ncsh', 'pcsh', 'elec'],
+    'hazd': ['hydr', 'clim'],
+    'hydr': ['fdep', 'slop'],
+    'clim': ['prec', 'tavg', 'wind'],
+}
+
+
+def leafIndicators(tree, node):
+    '''
+    Returns the indicators under a node of the tree
+    '''
+    if node not in tree:
+        return [node]
+    leaves = []
+    for child in tree[node]:
+        leaves.extend(leafIndicators(tree, child))
+    return leaves
+
+
+def blockWeights(tree, names, weights, nodes=None):
+    '''
+    Compiles the tree into a sparse block-weight matrix.
+
+    names   - indicator names in the column order of the data matrix
+    weights - indicator weights in the same order
+    nodes   - sub-domains to evaluate (default: all nodes of the tree)
+
+    Indicators of the tree that are not in names are ignored, so the same
+    tree serves indicator subsets (e.g., without flood-dependent indicators).
+    Returns (nodes, W) where W is a (len(names) x len(nodes)) CSC matrix whose
+    columns sum to 1.
+    '''
+    nodes = list(tree.keys()) if nodes is None else list(nodes)
+    weights = np.asarray(weights, dtype='float64')
+    column = {name: i for i, name in enumerate(names)}
+    rows, cols, vals = [], [], []
+    for j, node in enumerate(nodes):
+        rdx = np.array([column[leaf] for leaf in leafIndicators(tree, node)
+                        if leaf in column], dtype=int)
+        rows.append(rdx)
+        cols.append(np.full(len(rdx), j))
+        vals.append(weights[rdx]/weights[rdx].sum())
+    W = sparse.csc_matrix((np.concatenate(vals),
+                           (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(len(names), len(nodes)))
+    return nodes, W
+
+
+def evaluateComposite(data, nodes, W):
+    '''
+    Returns a dictionary of sub-domain scores (vectors over cells, in the data
+    type of data, e.g., float32) from a (cells x indicators) data matrix in a
+    single matrix multiplication.
+    '''
+    score = np.asfortranarray(W.T.dot(data.T).T, dtype=data.dtype)
+    return {node: score[:,j] for j, node in enumerate(nodes)}
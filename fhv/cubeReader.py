@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+'''
+Lazy, chunked reader of (time, lat, lon) cubes of PISCO and NMME (NetCDF).
+
+A cube is opened without reading data, and time chunks are read one at a
+time, so reductions over the whole record (district means, seasonal sums,
+climatologies) run in constant memory. Cell vectors follow the grid ID order
+of graticuleExtent (column-major, order='F'); instead of transposing each
+chunk into that order, cell indices and the columns of sparse weight matrices
+are mapped to the row-major (lat, lon) layout of the file. A valid-cell mask
+(cached by gridMeta) can be set on a cube, and no-value cells are then NaN in
+every chunk.
+
+    - openCube(fn, var, lat='latitude', lon='longitude', chunk=120)
+    - setValid(cube, valid)
+    - iterChunks(cube, chunk=None)
+    - cellIndex(cells, shape, order='F')
+    - readCells(cube, cells, chunk=None, order='F')
+    - timeMinMax(cube, chunk=None)
+    - validCells(cube, chunk=None)
+    - zonalMeanStream(cube, W, chunk=None)
+    - groupSum(cube, labels, ngroup, chunk=None)
+'''
+import numpy as np
+from netCDF4 import Dataset
+
+
+def openCube(fn, var, lat='latitude', lon='longitude', chunk=120):
+    '''
+    Opens a (time, lat, lon) variable of a NetCDF file lazily.
+
+    chunk - default number of time steps per chunk
+    '''
+    nc = Dataset(fn, 'r')
+    data = nc.variables[var]
+    data.set_auto_mask(False)
+    ntim, nlat, nlon = data.shape
+    fill = getattr(data, '_FillValue', None)
+    return {'fn': fn, 'nc': nc, 'data': data, 'shape': (nlat, nlon), 'ntim': ntim,
+            'lat': np.array(nc.variables[lat]), 'lon': np.array(nc.variables[lon]),
+            'fill': fill, 'chunk': chunk, 'valid': None}
+
+
+def setValid(cube, valid):
+    '''
+    Sets the valid cells ((cells,) boolean vector in column-major order, e.g.,
+    from gridMeta) of a cube
+    '''
+    nlat, nlon = cube['shape']
+    cube['valid'] = np.asarray(valid, dtype=bool).reshape(nlon, nlat).T.copy()
+    return cube
+
+
+def iterChunks(cube, chunk=None):
+    '''
+    Yields (time slice, (time, lat, lon) float64 block) over the record; fill
+    values and no-value cells (if set) are NaN
+    '''
+    chunk = cube['chunk'] if chunk is None else chunk
+    for t0 in range(0, cube['ntim'], chunk):
+        tslice = slice(t0, min(t0 + chunk, cube['ntim']))
+        block = np.asarray(cube['data'][tslice], dtype='float64')
+        if cube['fill'] is not None:
+            block[block == cube['fill']] = np.nan
+        if cube.get('valid') is not None:
+            block[:, ~cube['valid']] = np.nan
+        yield tslice, block
+
+
+def cellIndex(cells, shape, order='F'):
+    '''
+    Returns (lat, lon) indices of cell IDs (0-based) of a grid
+    '''
+    return np.unravel_index(np.asarray(cells, dtype=np.int64), shape, order=order)
+
+
+def readCells(cube, cells, chunk=None, order='F'):
+    '''
+    Reads time series of a set of cells as a (time x cells) array, one chunk
+    at a time
+    '''
+    ilat, ilon = cellIndex(cells, cube['shape'], order)
+    out = np.empty((cube['ntim'], len(ilat)))
+    for tslice, block in iterChunks(cube, chunk):
+        out[tslice] = block[:, ilat, ilon]
+    return out
+
+
+def timeMinMax(cube, chunk=None):
+    '''
+    Minimum and maximum over time of every cell, as (cells,) vectors in
+    column-major cell order
+    '''
+    vmin = np.full(cube['shape'], np.inf); vmax = np.full(cube['shape'], -np.inf)
+    for _, block in iterChunks(cube, chunk):
+        np.fmin(vmin, np.fmin.reduce(block, 0), out=vmin)
+        np.fmax(vmax, np.fmax.reduce(block, 0), out=vmax)
+    return vmin.ravel(order='F'), vmax.ravel(order='F')
+
+
+def validCells(cube, chunk=None):
+    '''
+    Valid cells as a (cells,) boolean vector in column-major cell order; a
+    cell has no value if all its values are missing (the maximum is -inf) or
+    the minimum of the cube (negative fill of PISCO)
+    '''
+    vmin, vmax = timeMinMax(cube, chunk)
+    return np.isfinite(vmax) & (vmax != vmin.min())
+
+
+def _rowMajorColumns(W, shape):
+    # Columns of W (column-major cell IDs) reordered to row-major cells
+    nlat, nlon = shape
+    order = np.arange(nlat*nlon).reshape(nlat, nlon).ravel(order='F')
+    perm = np.empty_like(order); perm[order] = np.arange(nlat*nlon)
+    return W.tocsc()[:, perm].tocsr()
+
+
+def zonalMeanStream(cube, W, chunk=None):
+    '''
+    Area-weighted means in all zones (W from gridWeights.weightMatrix) for all
+    time steps, as a (time x zones) array, streaming over time chunks
+    '''
+    Wr = _rowMajorColumns(W, cube['shape'])
+    empty = (W.getnnz(1) == 0)
+    out = np.empty((cube['ntim'], W.shape[0]))
+    for tslice, block in iterChunks(cube, chunk):
+        field = block.reshape(block.shape[0], -1)
+        out[tslice] = Wr.dot(field.T).T
+    out[:, empty] = np.nan
+    return out
+
+
+def groupSum(cube, labels, ngroup, chunk=None):
+    '''
+    Sums and valid counts of time steps by group (e.g., season of each year),
+    as (ngroup x cells) arrays in column-major cell order.
+
+    labels - group of each time step (0, ..., ngroup-1); negative is excluded
+    '''
+    labels = np.asarray(labels)
+    nlat, nlon = cube['shape']
+    total = np.zeros((ngroup, nlat, nlon)); count = np.zeros((ngroup, nlat, nlon))
+    for tslice, block in iterChunks(cube, chunk):
+        lab = labels[tslice]
+        for g in np.unique(lab[lab >= 0]):
+            sub = block[lab == g]
+            total[g] += np.nansum(sub, 0)
+            count[g] += np.sum(~np.isnan(sub), 0)
+    return total.transpose(0,2,1).reshape(ngroup, -1), \
+           count.transpose(0,2,1).reshape(ngroup, -1)
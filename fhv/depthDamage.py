@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+'''
+Depth-damage functions for affected population, GDP, and facilities.
+
+A curve is a piecewise-linear table of (depth, damage fraction) breakpoints,
+evaluated with np.interp (constant beyond the last breakpoint). The usual
+"affected value increases linearly with water level until a threshold" is the
+two-point curve ((0, thsd), (0, 1)) and is evaluated with np.clip. Curves are
+given as a number (linear-to-threshold), a (depth, fraction) pair, or a name
+of the JRC global depth-damage functions, and can be assigned per land-cover
+class (data/tLandCover.xlsx). Damage fractions are written into a reusable
+buffer, and values that share a curve (e.g., population and GDP) share one
+evaluation.
+
+    - asCurve(curve, scale=1)
+    - damageRatio(depth, curve, out=None)
+    - landCoverCurves(fn=..., curves=LANDCOVER_JRC, scale=1)
+    - damageRatioByClass(depth, lcov, curves, out=None)
+    - affectedMaps(depth, exposures, out=None)
+    - affectedCount(depth, curve)
+'''
+import os
+import numpy as np
+import pandas as pd
+
+# JRC global flood depth-damage functions (after Huizinga et al., 2017) for
+# South America; depth in meters and damage fraction of the maximum damage
+JRC_DEPTH = [0, 0.5, 1, 1.5, 2, 3, 4, 5, 6]
+JRC_CURVES = {
+    'residential': (JRC_DEPTH, [0, 0.49, 0.71, 0.84, 0.91, 0.98, 1, 1, 1]),
+    'commercial': (JRC_DEPTH, [0, 0.46, 0.67, 0.80, 0.88, 0.96, 1, 1, 1]),
+    'agriculture': (JRC_DEPTH, [0, 0.30, 0.55, 0.65, 0.75, 0.85, 0.95, 1, 1]),
+}
+
+# JRC curve of ESA CCI land-cover classes (keyword of the label in
+# tLandCover.xlsx); classes without a curve (e.g., forest, water) are not damaged
+LANDCOVER_JRC = {
+    'Urban': 'residential',
+    'Cropland': 'agriculture',
+    'Mosaic cropland': 'agriculture',
+}
+
+
+def asCurve(curve, scale=1):
+    '''
+    Returns (depth, fraction) breakpoints of a curve given as a threshold
+    (linear-to-threshold), a (depth, fraction) pair, or a JRC curve name.
+
+    scale - depth unit of the data per meter of a JRC curve (e.g., 10 for
+            GLOFRIS depths in decimeters)
+    '''
+    if np.isscalar(curve) and not isinstance(curve, str):
+        return np.array([0, curve], dtype='float64'), np.array([0, 1.])
+    if isinstance(curve, str):
+        xp, fp = JRC_CURVES[curve]
+        return np.asarray(xp, dtype='float64')*scale, np.asarray(fp, dtype='float64')
+    xp, fp = np.asarray(curve[0], dtype='float64'), np.asarray(curve[1], dtype='float64')
+    if (xp.shape != fp.shape) or np.any(np.diff(xp) <= 0):
+        raise ValueError('curve depths should be increasing and match fractions.')
+    return xp, fp
+
+
+def damageRatio(depth, curve, out=None):
+    '''
+    Damage fraction (0-1) of flood depths (into out, if given, to reuse a
+    buffer). NaN depths remain NaN.
+    '''
+    xp, fp = asCurve(curve)
+    if out is None:
+        out = np.empty(np.shape(depth), dtype='float64')
+    if (len(xp) == 2) and (xp[0] == 0) and (fp[0] == 0) and (fp[1] == 1):
+        np.divide(depth, xp[1], out=out)
+        np.clip(out, 0, 1, out=out)
+    else:
+        out[...] = np.interp(depth, xp, fp)
+    return out
+
+
+def landCoverCurves(fn=os.path.join('data', 'tLandCover.xlsx'),
+                    curves=LANDCOVER_JRC, scale=1):
+    '''
+    Returns a dictionary of land-cover class: curve from the class table, where
+    a class takes the curve of the first keyword that starts its label
+    '''
+    table = pd.read_excel(fn)
+    classCurves = {}
+    for lcls, label in zip(table['class'], table['label']):
+        for keyword, curve in curves.items():
+            if str(label).startswith(keyword):
+                classCurves[int(lcls)] = asCurve(curve, scale)
+                break
+    return classCurves
+
+
+def damageRatioByClass(depth, lcov, curves, out=None):
+    '''
+    Damage fraction of flood depths with a curve per land-cover class.
+    Cells of classes without a curve have zero damage.
+    '''
+    depth = np.asarray(depth)
+    if out is None:
+        out = np.empty(depth.shape, dtype='float64')
+    out.fill(0)
+    for lcls, curve in curves.items():
+        cell = (lcov == lcls)
+        out[cell] = damageRatio(depth[cell], curve)
+    return out
+
+
+def affectedMaps(depth, exposures, out=None):
+    '''
+    Affected values of several exposures in one pass over the depths.
+
+    exposures - dictionary of name: (value, curve); value is an array on the
+                depth grid and curve as in asCurve
+    out       - optional buffer of damage fractions (depth shape)
+
+    Exposures with the same curve share one evaluation of damage fractions.
+    Returns a dictionary of name: affected value (value * damage fraction).
+    '''
+    ratio = np.empty(np.shape(depth), dtype='float64') if out is None else out
+    groups = {}
+    for name, (value, curve) in exposures.items():
+        xp, fp = asCurve(curve)
+        groups.setdefault((tuple(xp), tuple(fp)), []).append(name)
+    afft = {}
+    for (xp, fp), names in groups.items():
+        damageRatio(depth, (xp, fp), out=ratio)
+        for name in names:
+            afft[name] = ratio*exposures[name][0]
+    return afft
+
+
+def affectedCount(depth, curve):
+    '''
+    Number of affected facilities (sum of damage fractions) from the flood
+    depths at facilities; NaN depths (e.g., out of the flood map) are ignored.
+    '''
+    return np.nansum(damageRatio(depth, curve))
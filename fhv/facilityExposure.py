@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+'''
+Flood exposure of health facilities by raster point sampling.
+
+Facility points are loaded once and converted to pixel (row, col) indices of
+a grid with the inverse of its affine transform (cached per transform), so
+that flood depths at all facilities are sampled from any depth raster, or a
+(scenarios x rows x cols) stack, by fancy indexing. No depth needs to be
+joined to the facilities beforehand in GIS.
+
+    - loadFacilities(fn=..., categories=None)
+    - pixelIndex(x, y, grid)
+    - facilityIndex(fn, grid, categories=None)
+    - sampleDepth(depth, index, fill=np.nan, mask=None)
+    - affectedFacilities(depth, index, curve, mask=None)
+'''
+import os
+import numpy as np
+import geopandas as gpd
+import depthDamage as dd
+
+# Health facilities of GeoMINSA (see data_preprocessing.ipynb)
+MINSA_FN = os.path.join('data', 'health_facility_MINSA.shp')
+
+# Loaded facilities and inverse transforms
+_facilities = {}
+_inverse = {}
+
+
+def loadFacilities(fn=MINSA_FN, categories=None):
+    '''
+    Returns facility points (GeoDataFrame), read only once per file.
+
+    categories - optional list of facility categories to keep (e.g., 'I-4')
+    '''
+    key = os.path.abspath(fn)
+    if key not in _facilities:
+        _facilities[key] = gpd.read_file(fn)
+    gdf = _facilities[key]
+    if categories is not None:
+        gdf = gdf[gdf.category.isin(categories)]
+    return gdf
+
+
+def pixelIndex(x, y, grid):
+    '''
+    Returns pixel (row, col) indices of points on the grid and a flag of points
+    inside the grid
+    '''
+    key = tuple(grid['transform'])[:6]
+    if key not in _inverse:
+        _inverse[key] = ~grid['transform']
+    inv = _inverse[key]
+    x, y = np.asarray(x, dtype='float64'), np.asarray(y, dtype='float64')
+    col = np.floor(inv.a*x + inv.b*y + inv.c).astype(np.int64)
+    row = np.floor(inv.d*x + inv.e*y + inv.f).astype(np.int64)
+    nrow, ncol = grid['shape']
+    inside = (row >= 0) & (row < nrow) & (col >= 0) & (col < ncol)
+    return row, col, inside
+
+
+def facilityIndex(fn, grid, categories=None):
+    '''
+    Returns a facility index {row, col, inside, shape} of facility points on
+    the grid, to be used for sampling any raster on that grid
+    '''
+    gdf = loadFacilities(fn, categories)
+    row, col, inside = pixelIndex(gdf.geometry.x, gdf.geometry.y, grid)
+    return {'row': row, 'col': col, 'inside': inside,
+            'shape': tuple(grid['shape'])}
+
+
+def sampleDepth(depth, index, fill=np.nan, mask=None):
+    '''
+    Samples flood depths at facilities.
+
+    depth - (rows x cols) raster or (scenarios x rows x cols) stack
+    fill  - value of facilities outside the grid
+    mask  - optional (rows x cols) boolean raster of cells without flood
+            (e.g., out-of-country cells); facilities on them take zero depth,
+            as if the raster were zeroed there (read-only stacks are not
+            modified)
+
+    Returns (facilities,) or (scenarios x facilities) depths.
+    '''
+    row = np.where(index['inside'], index['row'], 0)
+    col = np.where(index['inside'], index['col'], 0)
+    sample = np.asarray(depth[..., row, col], dtype='float64')
+    if mask is not None:
+        sample[..., index['inside'] & np.asarray(mask)[row, col]] = 0
+    sample[..., ~index['inside']] = fill
+    return sample
+
+
+def affectedFacilities(depth, index, curve, mask=None):
+    '''
+    Number of affected facilities (sum of damage fractions) of a depth raster,
+    or of every scenario of a depth stack (mask as sampleDepth)
+    '''
+    ratio = dd.damageRatio(sampleDepth(depth, index, mask=mask), curve)
+    return np.nansum(ratio, axis=-1)
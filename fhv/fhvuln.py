@@ -3,10 +3,15 @@ import os
 import gdal
 import numpy as np
 import rasterio
+import rasterio.crs
 import pandas as pd
 import geopandas as gpd
 import xlrd
 import re
+from scipy import ndimage
+from scipy.spatial import cKDTree
+import rasterIO as rio
+import depthDamage as dd
 
 def make_raster(in_ds, fn, data, data_type, nodata=None):
     """Create a one-band GeoTiff.
@@ -16,21 +21,20 @@ def make_raster(in_ds, fn, data, data_type, nodata=None):
     data      - Numpy array containing data to archive
     data_type - output data type
     nodata    - optional NoData burn_values
+
+    Returns the created GeoTiff opened (read-only) as a GDAL dataset.
     """
 
-    driver = gdal.GetDriverByName('gtiff')
-    out_ds = driver.Create(
-        fn, in_ds.RasterXSize, in_ds.RasterYSize, 1, data_type)
-    out_ds.SetProjection(in_ds.GetProjection())
-    out_ds.SetGeoTransform(in_ds.GetGeoTransform())
-    out_band = out_ds.GetRasterBand(1)
-    if nodata is not None:
-        out_band.SetNoDataValue(nodata)
-    out_band.WriteArray(data)
-    out_band.FlushCache()
-    #out_band.ComputerStaitstics(False)
-    print('"{}" is printed.'.format(fn))
-    return out_ds
+    # Written through the shared raster I/O (the file is closed on return);
+    # the grid is taken from the datasource itself, so in-memory and VRT
+    # datasources work as well
+    dtype = gdal.GetDataTypeName(data_type).lower().replace('byte', 'uint8')
+    wkt = in_ds.GetProjection()
+    meta = {'crs': rasterio.crs.CRS.from_wkt(wkt) if wkt else None,
+            'transform': rasterio.Affine.from_gdal(*in_ds.GetGeoTransform()),
+            'width': in_ds.RasterXSize, 'height': in_ds.RasterYSize}
+    rio.writeRaster(fn, data, meta, dtype, nodata)
+    return gdal.Open(fn)
 
 
 def upazilaToTable(df, noi, column):
@@ -147,9 +151,7 @@ def censusToRaster(out_fn, meta, idmap, data):
         idmap[idmap == i] = data[i]
     
     # Write a raster
-    with rasterio.open(out_fn, 'w', **meta) as dest:
-        dest.write(idmap[None,:,:])
-        print('%s is saved.' % out_fn)
+    rio.writeRaster(out_fn, idmap, meta)
         
         
 
@@ -211,13 +213,59 @@ def evaluation(name, index, code4):
     core = index[~mask]
     print('{} max: {:.3f}, min: {:.3f}'.format(name, core.max(), core.min()))
     
-def climInterpolate(clim, code4):
+def climInterpolate(clim, code4, nodata=None, method='nearest', k=8):
+    '''
+    Fill missing climate cells inside the country from the nearest valid cells.
+    
+    clim    - a layer (rows, cols) or a stack of layers (rows, cols, nlayer)
+    code4   - code map; cells equal to code4[0,0] are outside the country
+    nodata  - missing value; NaN is always missing. Default is the minimum of 
+              each layer.
+    method  - 'nearest' (distance transform) or 'idw' (inverse-distance 
+              weighting of the k nearest valid cells)
+    
+    Layers sharing the same pattern of missing cells (e.g., monthly WorldClim
+    layers) share one nearest-neighbour search, so a full stack is filled in 
+    a single call.
+    '''
     
-#    clim = prec.copy()
+    stack = clim if clim.ndim == 3 else clim[:,:,None]
+    nrow, ncol, nlay = stack.shape
+    if nodata is None:
+        nodata = np.nanmin(stack.reshape(-1, nlay), axis=0)
+    miss = np.isnan(stack) | (stack == nodata)
+    yc = (code4 != code4[0,0])
+    
+    # Group layers by their missing-cell pattern
+    pattern, group = np.unique(miss.reshape(-1, nlay).T, axis=0, 
+                               return_inverse=True)
+    group = np.ravel(group)
+    for g in range(len(pattern)):
+        lay = np.where(group == g)[0]
+        gmiss = pattern[g].reshape(nrow, ncol)
+        r, c = np.where(gmiss & yc)
+        if (len(r) == 0) or gmiss.all():
+            continue
+        if method == 'nearest':
+            # Row and column of the nearest valid cell for every cell
+            ii, jj = ndimage.distance_transform_edt(gmiss, 
+                                                    return_distances=False,
+                                                    return_indices=True)
+            stack[r[:,None], c[:,None], lay] = \
+                stack[ii[r,c][:,None], jj[r,c][:,None], lay]
+        elif method == 'idw':
+            vr, vc = np.where(~gmiss)
+            tree = cKDTree(np.column_stack((vr, vc)))
+            dist, ind = tree.query(np.column_stack((r, c)), k=min(k, len(vr)))
+            dist = dist.reshape(len(r), -1); ind = ind.reshape(len(r), -1)
+            wght = 1/dist**2
+            wght = wght/wght.sum(1)[:,None]
+            value = stack[vr[ind][:,:,None], vc[ind][:,:,None], lay]
+            stack[r[:,None], c[:,None], lay] = np.einsum('ij,ijk->ik', 
+                                                        wght, value)
+        else:
+            raise ValueError('method should be either "nearest" or "idw".')
     
-    x,y = np.where((clim == clim.min()) & (code4 != code4[0,0]))
-    clim[x,y] = clim[clim != clim.min()].mean()
-        
     return clim
     
     
@@ -226,12 +274,8 @@ def affectedGdpFlood(gdp, fdep):
     Calculated total affected GDP by flood levels
     '''
     
-    gdpdata = gdp.copy(); depth = fdep.copy()
-    
-    depth[depth <= 30] = depth[depth <= 30]/30
-    depth[depth > 30] = 1
-    
-    gdpAfft = np.sum(depth*gdpdata)
+    # Linear to 3 meters (depth in decimeters)
+    gdpAfft = np.sum(dd.damageRatio(fdep, 30)*gdp)
     
     return gdpAfft
     
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+'''
+Flood risk over the full set of GLOFRIS return periods.
+
+Depths of all return periods are handled as one (return periods x cells)
+array, so affected population and GDP of every return period are
+computed in one vectorized pass, per administrative unit through a sparse
+(cells x zones) matrix. Impacts are then integrated over the annual
+exceedance probability (1/return period) to expected annual impacts.
+
+    - zoneMatrix(zone)
+    - affectedByReturnPeriod(depth, value, curve, Z=None)
+    - expectedAnnualImpact(impact, rps)
+    - riskTable(impacts, rps, ids=None)
+'''
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import depthDamage as dd
+
+RETURN_PERIODS = [2, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+
+def zoneMatrix(zone):
+    '''
+    Returns zone IDs and a sparse (cells x zones) indicator matrix
+    '''
+    ids, code = np.unique(np.ravel(zone), return_inverse=True)
+    ncell = code.size
+    Z = sparse.csr_matrix((np.ones(ncell), (np.arange(ncell), np.ravel(code))),
+                          shape=(ncell, len(ids)))
+    return ids, Z
+
+
+def affectedByReturnPeriod(depth, value, curve, Z=None):
+    '''
+    Affected value (e.g., population or GDP) of every return period.
+
+    depth - (return periods x cells) flood depths
+    value - (cells,) exposed value
+    curve - depth-damage curve (see depthDamage.asCurve); a number is the
+            depth at which the whole value is affected (linear below it)
+    Z     - optional (cells x zones) matrix from zoneMatrix()
+
+    Returns (return periods,) totals or (return periods x zones) if Z given.
+    '''
+    ratio = dd.damageRatio(depth, curve)
+    if Z is None:
+        return ratio @ value
+    return np.asarray(Z.T.dot((ratio*value).T).T)
+
+
+def expectedAnnualImpact(impact, rps):
+    '''
+    Integrates impacts over the annual exceedance probability (trapezoidal).
+
+    impact - (return periods, ...) impacts
+    rps    - return periods of the first axis
+
+    Impacts more frequent than the smallest return period are taken as zero;
+    impacts rarer than the largest return period are taken as those of the
+    largest return period.
+    '''
+    prob = 1/np.asarray(rps, dtype='float64')
+    order = np.argsort(prob)
+    prob = prob[order]; impact = np.asarray(impact, dtype='float64')[order]
+    dp = np.diff(prob).reshape((-1,) + (1,)*(impact.ndim - 1))
+    eai = np.sum((impact[1:] + impact[:-1])/2*dp, axis=0)
+    return eai + impact[0]*prob[0]
+
+
+def riskTable(impacts, rps, ids=None):
+    '''
+    Returns a DataFrame of impacts of every return period and the expected
+    annual impact (<name>_rp00010, ..., <name>_EAI).
+
+    impacts - dictionary of name: (return periods,) or (return periods x zones)
+    ids     - zone IDs (index of the table)
+    '''
+    table = {}
+    for name, impact in impacts.items():
+        impact = np.atleast_2d(np.asarray(impact, dtype='float64').T).T
+        for i, rp in enumerate(rps):
+            table['%s_rp%05d' % (name, rp)] = impact[i]
+        table['%s_EAI' % name] = expectedAnnualImpact(impact, rps)
+    index = pd.Index(ids if ids is not None else [0], name='zone')
+    return pd.DataFrame(table, index=index)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''
+Aligns rasters to a canonical grid (transform, shape, CRS).
+
+Each input raster is read only over the window covering the target grid,
+resampled onto the grid, and cached on disk as a memory-mapped array (.npy)
+keyed by the source file, the target grid and the resampling method. Loading
+the same indicators again is then a memory map instead of a re-projection.
+
+    - gridFromRaster(fn)
+    - alignRaster(fn, grid, resampling='nearest', ...)
+    - alignRasters(fns, grid, resampling='nearest', nproc=4, ...)
+    - alignStack(fns, grid, resampling='nearest', nproc=4, ...)
+'''
+import os
+import hashlib
+import numpy as np
+import rasterio
+from rasterio.windows import from_bounds
+from rasterio.warp import reproject, transform_bounds, Resampling
+from rasterio.transform import array_bounds
+from concurrent.futures import ThreadPoolExecutor
+import rasterIO as rio
+
+
+def gridFromRaster(fn):
+    '''
+    Returns a grid definition {transform, shape, crs} of a raster
+    '''
+    with rio.borrowRaster(fn) as src:
+        grid = {'transform': src.transform,
+                'shape': (src.height, src.width),
+                'crs': src.crs}
+    return grid
+
+
+def sourceHash(fn):
+    '''
+    Signature of a source file from its path, size and modification time
+    '''
+    stat = os.stat(fn)
+    text = '{}|{}|{}'.format(os.path.abspath(fn), stat.st_size, stat.st_mtime_ns)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def gridHash(grid):
+    '''
+    Signature of a grid definition
+    '''
+    text = '{}|{}|{}'.format(tuple(grid['transform'])[:6],
+                             tuple(grid['shape']),
+                             grid['crs'].to_wkt())
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def alignRaster(fn, grid, resampling='nearest', band=1, dtype=None,
+                nodata=None, cache=os.path.join('data', 'aligned', 'cache')):
+    '''
+    Returns a band of a raster aligned to the grid as a read-only memory map.
+
+    fn         - path to the source raster
+    grid       - grid definition from gridFromRaster()
+    resampling - name of rasterio Resampling method
+    dtype      - output data type (default: source data type)
+    nodata     - output NoData value (default: source NoData, NaN for float
+                 sources and 0 for integer sources without NoData)
+    cache      - directory of cached aligned arrays
+    '''
+    with rio.borrowRaster(fn) as src:
+        src_dtype, src_nodata, src_crs = src.dtypes[band-1], src.nodata, src.crs
+        src_transform, src_shape = src.transform, (src.height, src.width)
+    dtype = np.dtype(src_dtype if dtype is None else dtype)
+    if nodata is None:
+        if src_nodata is not None:
+            nodata = src_nodata
+        elif dtype.kind == 'f':
+            nodata = np.nan
+        else:
+            nodata = 0
+    key = hashlib.sha1('{}|{}|{}|{}|{}|{}'.format(
+        sourceHash(fn), gridHash(grid), resampling, band, dtype.str,
+        nodata).encode()).hexdigest()
+    out_fn = os.path.join(cache, key + '.npy')
+    if os.path.isfile(out_fn):
+        return np.load(out_fn, mmap_mode='r')
+
+    # Read the window of the source that covers the target grid (+1 cell)
+    bounds = array_bounds(*grid['shape'], grid['transform'])
+    if src_crs != grid['crs']:
+        bounds = transform_bounds(grid['crs'], src_crs, *bounds)
+    window = from_bounds(*bounds, transform=src_transform)
+    window = window.round_offsets('floor').round_lengths('ceil')
+    window = rasterio.windows.Window(window.col_off - 1, window.row_off - 1,
+                                     window.width + 2, window.height + 2)
+    window = window.intersection(
+        rasterio.windows.Window(0, 0, src_shape[1], src_shape[0]))
+    data = rio.readRaster(fn, band, window=window)
+
+    # Resample into a memory-mapped array on the target grid
+    os.makedirs(cache, exist_ok=True)
+    tmp_fn = out_fn + '.tmp'
+    out = np.lib.format.open_memmap(tmp_fn, mode='w+', dtype=dtype,
+                                    shape=tuple(grid['shape']))
+    out[:] = nodata
+    reproject(source=data, destination=out,
+              src_transform=rasterio.windows.transform(window, src_transform),
+              src_crs=src_crs, src_nodata=src_nodata,
+              dst_transform=grid['transform'], dst_crs=grid['crs'],
+              dst_nodata=nodata, resampling=Resampling[resampling])
+    out.flush(); del out
+    os.replace(tmp_fn, out_fn)
+
+    return np.load(out_fn, mmap_mode='r')
+
+
+def alignRasters(fns, grid, resampling='nearest', nproc=4, **kwargs):
+    '''
+    Aligns multiple rasters to the grid in parallel.
+
+    fns is either a list of paths (a list of arrays is returned) or a
+    dictionary of name: path (a dictionary of name: array is returned).
+    '''
+    names = list(fns.keys()) if isinstance(fns, dict) else None
+    paths = list(fns.values()) if names is not None else list(fns)
+    with ThreadPoolExecutor(max_workers=nproc) as pool:
+        layers = list(pool.map(
+            lambda fn: alignRaster(fn, grid, resampling, **kwargs), paths))
+    if names is not None:
+        return dict(zip(names, layers))
+    return layers
+
+
+def alignStack(fns, grid, resampling='nearest', nproc=4,
+               cache=os.path.join('data', 'aligned', 'cache'), **kwargs):
+    '''
+    Aligns rasters to the grid and returns them as one read-only memory-mapped
+    (nlayer, rows, cols) stack, cached by the sources, grid and options.
+    '''
+    key = hashlib.sha1('{}|{}|{}|{}'.format(
+        [sourceHash(fn) for fn in fns], gridHash(grid), resampling,
+        sorted(kwargs.items())).encode()).hexdigest()
+    out_fn = os.path.join(cache, key + '.stack.npy')
+    if os.path.isfile(out_fn):
+        return np.load(out_fn, mmap_mode='r')
+    layers = alignRasters(fns, grid, resampling, nproc, cache=cache, **kwargs)
+    tmp_fn = out_fn + '.tmp'
+    out = np.lib.format.open_memmap(tmp_fn, mode='w+', dtype=layers[0].dtype,
+                                    shape=(len(layers),) + tuple(grid['shape']))
+    for i, layer in enumerate(layers):
+        out[i] = layer
+    out.flush(); del out
+    os.replace(tmp_fn, out_fn)
+    return np.load(out_fn, mmap_mode='r')
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+'''
+Batch point-to-grid index resolver.
+
+Grids are registered by name (PISCO 0.1 degree, NMME 1 degree, and the 30s
+district grid), so no sample GeoTIFF has to be opened to get a transform.
+Arrays of lon/lat are mapped to (row, col) and column-major cell IDs in one
+call; points out of the grid are flagged, and points out of the grid or on
+no-value cells can be snapped to the nearest valid cell with a KD-tree over
+the valid cells (or to the nearest cell of the grid if no mask is given).
+
+    - registerGrid(name, grid)
+    - getGrid(name)
+    - gridFromCoords(lat, lon, crs='EPSG:4326')
+    - resolvePoints(lon, lat, grid, valid=None, snap=False, order='F')
+'''
+import os
+import numpy as np
+import pandas as pd
+from affine import Affine
+from scipy.spatial import cKDTree
+import gridAlign as ga
+import gridWeights as gw
+import facilityExposure as fe
+
+
+
+def _piscoGrid():
+    # Grid of the cached PISCOpm metadata (gridMeta imports this module)
+    import gridMeta as gm
+    return gm.loadMeta('PISCOpm', 'V2.1_beta')['grid']
+
+
+# Registered grids: a grid definition {transform, shape, crs}, a raster
+# filename, or a function returning a grid definition; filenames and
+# functions are resolved on first use
+GRIDS = {
+    # PISCOp V2.1 (0.1 degree, north-up; gridMeta cache of GridToAdminUnit.py)
+    'pisco': _piscoGrid,
+    # NMME (1 degree, longitude 0-360), north-up as the fields and weights of
+    # nmmeEnsemble (nmmeGrid of a member file is registered by nmmeWeights)
+    'nmme': gw.gridFromExtent([-0.5, 359.5, -90.5, 90.5], 1.0, 1.0),
+    # District grid of Peru (30 arc-second)
+    'dist30s': os.path.join('data', 'distid_30s.tif'),
+}
+
+
+def registerGrid(name, grid):
+    '''
+    Registers a grid definition (or a raster filename) by name
+    '''
+    GRIDS[name] = grid
+
+
+def getGrid(name):
+    '''
+    Returns a registered grid definition
+    '''
+    if isinstance(GRIDS[name], str):
+        GRIDS[name] = ga.gridFromRaster(GRIDS[name])
+    elif callable(GRIDS[name]):
+        GRIDS[name] = GRIDS[name]()
+    return GRIDS[name]
+
+
+def gridFromCoords(lat, lon, crs='EPSG:4326'):
+    '''
+    Returns a grid definition from vectors of cell-center coordinates (e.g.,
+    of a NetCDF file), in the row order of lat
+    '''
+    lat, lon = np.asarray(lat, dtype='float64'), np.asarray(lon, dtype='float64')
+    dx, dy = lon[1] - lon[0], lat[1] - lat[0]
+    return {'transform': Affine(dx, 0, lon[0] - dx/2, 0, dy, lat[0] - dy/2),
+            'shape': (len(lat), len(lon)), 'crs': crs}
+
+
+def resolvePoints(lon, lat, grid, valid=None, snap=False, order='F'):
+    '''
+    Resolves points to cells of a grid.
+
+    grid  - registered grid name or grid definition
+    valid - optional (cells,) boolean vector of valid cells (in order), e.g.,
+            the cached mask of gridMeta
+    snap  - if True, points out of the grid or on invalid cells are moved to
+            the nearest valid cell (distance in cells); without valid, points
+            out of the grid are moved to the nearest cell of the grid
+    order - order of cell IDs ('F': column-major as the PISCO grid IDs)
+
+    Longitudes are wrapped to the grid if it spans 0-360 degrees (NMME).
+
+    Returns a DataFrame of row, col, cell (-1 if unresolved), inside (in the
+    grid), valid (on a valid cell), and snap (distance of snapping in cells).
+    '''
+    grid = getGrid(grid) if isinstance(grid, str) else grid
+    shape = tuple(grid['shape'])
+    lon = np.asarray(lon, dtype='float64')
+    west, east = grid['transform'].c, grid['transform'].c + grid['transform'].a*shape[1]
+    if (west >= -abs(grid['transform'].a)) and (east > 180):
+        lon = (lon - west) % 360 + west
+    row, col, inside = fe.pixelIndex(lon, lat, grid)
+    cell = np.full(len(row), -1, dtype=np.int64)
+    cell[inside] = np.ravel_multi_index((row[inside], col[inside]), shape, order=order)
+    ok = inside.copy()
+    if valid is not None:
+        ok[inside] = np.asarray(valid, dtype=bool)[cell[inside]]
+    dist = np.zeros(len(row))
+    if snap and (~ok).any():
+        # Nearest (valid) cell center from the fractional position of points
+        inv = ~grid['transform']
+        x, y = lon[~ok], np.asarray(lat, dtype='float64')[~ok]
+        pos = np.column_stack((inv.d*x + inv.e*y + inv.f, inv.a*x + inv.b*y + inv.c))
+        if valid is None:
+            near = np.clip(np.floor(pos), 0, np.array(shape) - 1).astype(np.int64)
+            dist[~ok] = np.hypot(*(near + 0.5 - pos).T)
+            row[~ok], col[~ok] = near[:,0], near[:,1]
+        else:
+            vrow, vcol = np.unravel_index(np.flatnonzero(valid), shape, order=order)
+            tree = cKDTree(np.column_stack((vrow + 0.5, vcol + 0.5)))
+            dist[~ok], near = tree.query(pos)
+            row[~ok], col[~ok] = vrow[near], vcol[near]
+        cell[~ok] = np.ravel_multi_index((row[~ok], col[~ok]), shape, order=order)
+    else:
+        cell[~ok] = -1
+    return pd.DataFrame({'row': row, 'col': col, 'cell': cell, 'inside': inside,
+                         'valid': ok, 'snap': dist})
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+'''
+Grid metadata cached once per product version (e.g., PISCOpm V2.1).
+
+The metadata of a gridded product (valid-cell mask, affine transform, shape,
+and WGS84 cell areas) is computed once with a streaming reduction over the
+time axis (cubeReader.validCells) and cached as a small .npz file with the
+mask bit-packed (np.packbits). Readers and aggregators then take the mask
+from the cache (cubeReader.setValid, weight matrices, stores, anomalies)
+instead of rediscovering no-value cells by scanning the whole record. A cell
+has no value if all its values are the minimum of the cube (negative fill of
+PISCO) or missing. The cache keeps a signature of the source (file path, size
+and modification time, or the shape and coordinates of an in-memory cube) and
+is recomputed if the cube of the same product version does not match it.
+
+Cell vectors are in column-major order of the grid IDs (order='F').
+
+    - cubeSource(cube)
+    - computeMeta(cube, product, version, chunk=None)
+    - saveMeta(meta, path=META_DIR)
+    - loadMeta(product, version, path=META_DIR)
+    - gridMeta(cube, product, version, path=META_DIR, chunk=None)
+'''
+import os
+import hashlib
+import numpy as np
+from affine import Affine
+import cubeReader as cr
+import gridWeights as gw
+import gridAlign as ga
+import gridIndex as gi
+
+META_DIR = os.path.join('data', 'gridmeta')
+
+
+def _metaFile(product, version, path):
+    return os.path.join(path, '%s_%s.npz' % (product, version))
+
+
+def cubeSource(cube):
+    '''
+    Signature of the source of a cube: the file (gridAlign.sourceHash), or the
+    shape and coordinates if the cube has no file
+    '''
+    if cube.get('fn') is not None:
+        return ga.sourceHash(cube['fn'])
+    text = '{}|{}|{}'.format(tuple(cube['shape']),
+                             np.asarray(cube['lat'], dtype='float64').tobytes().hex(),
+                             np.asarray(cube['lon'], dtype='float64').tobytes().hex())
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def computeMeta(cube, product, version, chunk=None):
+    '''
+    Computes the metadata of a cube: valid cells, grid definition (from the
+    cell-center coordinates), and cell areas (km2)
+    '''
+    valid = cr.validCells(cube, chunk)
+    grid = gi.gridFromCoords(cube['lat'], cube['lon'])
+    t, (nlat, nlon) = grid['transform'], grid['shape']
+    lat1 = t.f + t.e*np.arange(nlat)
+    area = np.tile(gw.cellArea(lat1, lat1 + t.e, abs(t.a)), nlon)
+    return {'product': product, 'version': version, 'valid': valid,
+            'grid': grid, 'area': area, 'source': cubeSource(cube)}
+
+
+def saveMeta(meta, path=META_DIR):
+    '''
+    Saves metadata with a bit-packed mask
+    '''
+    os.makedirs(path, exist_ok=True)
+    fn = _metaFile(meta['product'], meta['version'], path)
+    grid = meta['grid']
+    np.savez(fn, valid=np.packbits(meta['valid']), ncell=len(meta['valid']),
+             transform=np.array(tuple(grid['transform'])[:6]),
+             shape=np.array(grid['shape']), crs=grid['crs'],
+             area=meta['area'].astype('float32'), source=meta['source'])
+    print('%s is saved.' % fn)
+
+
+def loadMeta(product, version, path=META_DIR):
+    '''
+    Loads cached metadata of a product version
+    '''
+    with np.load(_metaFile(product, version, path)) as npz:
+        valid = np.unpackbits(npz['valid'], count=int(npz['ncell'])).astype(bool)
+        grid = {'transform': Affine(*npz['transform']),
+                'shape': tuple(int(n) for n in npz['shape']),
+                'crs': str(npz['crs'])}
+        area = npz['area'].astype('float64')
+        source = str(npz['source']) if 'source' in npz else None
+    return {'product': product, 'version': version, 'valid': valid,
+            'grid': grid, 'area': area, 'source': source}
+
+
+def gridMeta(cube, product, version, path=META_DIR, chunk=None):
+    '''
+    Returns metadata of a product version from the cache, computing and
+    caching it first if it does not exist or was made from another source
+    '''
+    if os.path.exists(_metaFile(product, version, path)):
+        meta = loadMeta(product, version, path)
+        if meta['source'] == cubeSource(cube):
+            return meta
+    meta = computeMeta(cube, product, version, chunk)
+    saveMeta(meta, path)
+    return meta
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+'''
+Sparse grid-to-administrative-unit area weights.
+
+The intersection of a grid and administrative units (pieces of cells with
+the zone ID, the cell ID and the area of each piece) is compiled once into a
+sparse (zones x cells) matrix whose rows are area weights normalized to 1,
+excluding no-value cells. Spatial averages of a (time x cells) field over all
+zones and time steps are then a single sparse matrix multiplication.
+
+The intersection itself is computed here (no GIS step): each polygon is
+clipped only against the grid cells in its bounding box, which are known from
+the regular grid without any spatial index, with vectorized shapely
+operations. The area of a piece is its fraction of the cell (in degrees)
+times the area of the cell on the WGS84 ellipsoid, so areas are exact across
+the longitude range of Peru (unlike a single UTM zone). Polygons are processed
+in parallel threads (shapely releases the GIL).
+
+Cell IDs follow graticuleExtent: 0-based, column-major (order='F') from the
+upper-left cell, the same order as a (time, lon, lat) cube reshaped to
+(time, cells).
+
+    - gridFromExtent(extent, dx, dy)
+    - graticule(extent, dx, dy)
+    - cellArea(lat1, lat2, dlon)
+    - intersectPolygon(polygon, grid)
+    - gridIntersection(polygons, zone, grid, nproc=4)
+    - intersectionWeights(shp_fn, id_col, grid, valid=None, nproc=4)
+    - weightMatrix(zone, cell, area, ncell, valid=None)
+    - saveWeights(fn, ids, W)
+    - loadWeights(fn)
+    - zonalMean(W, field)
+'''
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+from scipy import sparse
+from rasterio.transform import from_origin
+from concurrent.futures import ThreadPoolExecutor
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1/298.257223563
+
+
+def gridFromExtent(extent, dx, dy):
+    '''
+    Returns a grid definition {transform, shape, crs} of a regular lon/lat
+    grid over extent [minx, maxx, miny, maxy]; the extent is a whole number of
+    cells (rounded, as float32 coordinates of NetCDF files are inexact)
+    '''
+    minx, maxx, miny, maxy = extent
+    ncol = int(round(abs(maxx - minx)/dx))
+    nrow = int(round(abs(maxy - miny)/dy))
+    return {'transform': from_origin(minx, maxy, dx, dy),
+            'shape': (nrow, ncol),
+            'crs': 'EPSG:4326'}
+
+
+def graticule(extent, dx, dy):
+    '''
+    Returns a GeoDataFrame of grid polygons (ID from 1 in column-major order)
+    with all cell corners generated by broadcasting and boxes in bulk. Cells
+    are clipped to the extent.
+    '''
+    minx, maxx, miny, maxy = extent
+    nrow, ncol = gridFromExtent(extent, dx, dy)['shape']
+    # Column-major order: columns (x) outer, rows (y) inner
+    x0 = np.minimum(minx + dx*np.arange(ncol), maxx)[:,None]
+    x1 = np.minimum(minx + dx*np.arange(1, ncol+1), maxx)[:,None]
+    y1 = np.maximum(maxy - dy*np.arange(nrow), miny)[None,:]
+    y0 = np.maximum(maxy - dy*np.arange(1, nrow+1), miny)[None,:]
+    x0, x1, y0, y1 = np.broadcast_arrays(x0, x1, y0, y1)
+    cells = shapely.box(x0.ravel(), y0.ravel(), x1.ravel(), y1.ravel())
+    return gpd.GeoDataFrame({'ID': np.arange(1, nrow*ncol + 1)},
+                            geometry=cells, crs='EPSG:4326')
+
+
+def cellArea(lat1, lat2, dlon):
+    '''
+    Area (km2) of a cell between latitudes lat1 and lat2 (degrees) with a
+    width of dlon (degrees) on the WGS84 ellipsoid
+    '''
+    e2 = WGS84_F*(2 - WGS84_F); e = np.sqrt(e2)
+    b2 = (WGS84_A*(1 - WGS84_F))**2
+    def q(lat):
+        s = np.sin(np.radians(lat))
+        return s/(1 - e2*s**2) + np.log((1 + e*s)/(1 - e*s))/(2*e)
+    return np.abs(b2/2*np.radians(dlon)*(q(lat2) - q(lat1)))/10**6
+
+
+def intersectPolygon(polygon, grid):
+    '''
+    Clips a polygon against the cells of a regular lon/lat grid in its
+    bounding box.
+
+    grid - {transform, shape} of the grid (north-up)
+
+    Returns (cell, area): 0-based cell IDs (column-major) and areas (km2) of
+    the pieces.
+    '''
+    t, (nrow, ncol) = grid['transform'], grid['shape']
+    dx, dy = t.a, -t.e
+    minx, miny, maxx, maxy = polygon.bounds
+    c0, c1 = max(int(np.floor((minx - t.c)/dx)), 0), min(int(np.ceil((maxx - t.c)/dx)), ncol)
+    r0, r1 = max(int(np.floor((t.f - maxy)/dy)), 0), min(int(np.ceil((t.f - miny)/dy)), nrow)
+    if (c0 >= c1) or (r0 >= r1):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    row, col = np.meshgrid(np.arange(r0, r1), np.arange(c0, c1), indexing='ij')
+    row, col = row.ravel(), col.ravel()
+    x0 = t.c + col*dx; y1 = t.f - row*dy
+    cells = shapely.box(x0, y1 - dy, x0 + dx, y1)
+    shapely.prepare(polygon)
+    hit = shapely.intersects(polygon, cells)
+    row, col, cells, y1 = row[hit], col[hit], cells[hit], y1[hit]
+    frac = shapely.area(shapely.intersection(cells, polygon))/(dx*dy)
+    ok = frac > 0
+    area = frac[ok]*cellArea(y1[ok] - dy, y1[ok], dx)
+    return (col[ok]*nrow + row[ok]).astype(np.int64), area
+
+
+def gridIntersection(polygons, zone, grid, nproc=4):
+    '''
+    Intersects polygons with a regular lon/lat grid in parallel threads.
+
+    Returns a DataFrame of pieces (zone, cell, area_km2).
+    '''
+    def run(i):
+        cell, area = intersectPolygon(polygons[i], grid)
+        return np.full(len(cell), i), cell, area
+    with ThreadPoolExecutor(max_workers=nproc) as pool:
+        parts = list(pool.map(run, range(len(polygons))))
+    index = np.concatenate([p[0] for p in parts])
+    return pd.DataFrame({'zone': np.asarray(zone)[index],
+                         'cell': np.concatenate([p[1] for p in parts]),
+                         'area_km2': np.concatenate([p[2] for p in parts])})
+
+
+def intersectionWeights(shp_fn, id_col, grid, valid=None, nproc=4):
+    '''
+    Returns zone IDs, the weight matrix, and the pieces of administrative
+    units (shapefile, zone ID in id_col) intersected with the grid
+    '''
+    gdf = gpd.read_file(shp_fn).to_crs(epsg=4326)
+    pieces = gridIntersection(gdf.geometry.values, gdf[id_col].values, grid, nproc)
+    nrow, ncol = grid['shape']
+    ids, W = weightMatrix(pieces.zone, pieces.cell, pieces.area_km2, nrow*ncol, valid)
+    return ids, W, pieces
+
+
+def weightMatrix(zone, cell, area, ncell, valid=None):
+    '''
+    Returns zone IDs and a (zones x cells) CSR matrix of area weights.
+
+    zone  - zone ID of each piece (e.g., IDDIST)
+    cell  - 0-based cell ID of each piece
+    area  - area of each piece
+    ncell - number of cells of the grid
+    valid - optional boolean (cells,) array; invalid (no-value) cells get no
+            weight
+
+    Pieces of the same cell and zone are summed, and each row is normalized to
+    1 over its valid cells. Zones without a valid cell have an empty row.
+    '''
+    zone = np.asarray(zone); cell = np.asarray(cell, dtype=np.int64)
+    area = np.asarray(area, dtype='float64')
+    ids = np.unique(zone)
+    if valid is not None:
+        keep = np.asarray(valid, dtype=bool)[cell]
+        zone, cell, area = zone[keep], cell[keep], area[keep]
+    row = np.searchsorted(ids, zone)
+    W = sparse.csr_matrix((area, (row, cell)), shape=(len(ids), ncell))
+    W.sum_duplicates()
+    total = np.asarray(W.sum(1)).ravel()
+    total[total == 0] = 1
+    W = sparse.diags(1/total).dot(W).tocsr()
+    return ids, W
+
+
+def saveWeights(fn, ids, W):
+    '''
+    Saves a weight matrix (fn.npz) and its zone IDs (fn_ids.npy); object IDs
+    (e.g., strings of a GeoDataFrame column) are saved as fixed-width strings
+    so that they are loaded without pickle
+    '''
+    ids = np.asarray(ids)
+    if ids.dtype == object:
+        ids = ids.astype(str)
+    sparse.save_npz(fn + '.npz', W)
+    np.save(fn + '_ids.npy', ids, allow_pickle=False)
+    print('%s.npz is saved.' % fn)
+
+
+def loadWeights(fn):
+    '''
+    Returns zone IDs and the weight matrix saved by saveWeights
+    '''
+    return np.load(fn + '_ids.npy'), \
+           sparse.load_npz(fn + '.npz').tocsr()
+
+
+def zonalMean(W, field):
+    '''
+    Area-weighted means of a (time x cells) field in all zones, as a
+    (time x zones) array. Zones without a valid cell are NaN.
+    '''
+    field = np.asarray(field)
+    out = np.asarray(W.dot(field.T).T, dtype='float64')
+    out[..., W.getnnz(1) == 0] = np.nan
+    return out
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+'''
+Packed store of indicator layers (replaces np.save of pickled dictionaries).
+
+A store is a directory with a JSON manifest and one raw .npy file per layer,
+so each layer can be memory-mapped and loaded on its own. Layers are kept as
+uint8 when all values are integers in 0-255 (e.g., binary indicators) and as
+float32 otherwise. If a mask is given (e.g., in-country cells), the masked
+cells of every grid layer are also saved as compressed vectors (masked.npz),
+which is all the composite index needs.
+
+    - saveStore(path, data, mask=None)
+    - layerNames(path)
+    - loadMask(path)
+    - loadLayer(path, name, masked=False)
+    - loadLayers(path, names=None, masked=False)
+'''
+import os
+import json
+import numpy as np
+
+MANIFEST = 'manifest.json'
+
+
+def _packType(array):
+    '''
+    Smallest lossless-enough data type of a layer (uint8 or float32)
+    '''
+    if (array.dtype.kind in 'biuf') and np.isfinite(array).all() and \
+       (array.min() >= 0) and (array.max() <= 255) and \
+       np.array_equal(array, np.round(array)):
+        return 'uint8'
+    elif array.dtype.kind == 'f':
+        return 'float32'
+    return array.dtype.str
+
+
+def saveStore(path, data, mask=None):
+    '''
+    Saves a dictionary of arrays to a store.
+
+    path   - directory of the store (created if not existing)
+    data   - dictionary of name: array
+    mask   - boolean grid of cells to be saved as compressed vectors
+    '''
+    os.makedirs(path, exist_ok=True)
+    manifest = {'layers': {}, 'shape': None, 'ncell': None}
+    vectors = {}
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        manifest['shape'] = list(mask.shape)
+        manifest['ncell'] = int(mask.sum())
+        np.save(os.path.join(path, 'mask.npy'), np.packbits(mask.ravel()))
+    for name, array in data.items():
+        array = np.asarray(array)
+        dtype = _packType(array)
+        np.save(os.path.join(path, name + '.npy'), array.astype(dtype))
+        grid = (mask is not None) and (array.shape == mask.shape)
+        if grid:
+            vectors[name] = array[mask].astype(dtype)
+        manifest['layers'][name] = {'dtype': dtype, 'shape': list(array.shape),
+                                    'masked': bool(grid)}
+    if vectors:
+        np.savez_compressed(os.path.join(path, 'masked.npz'), **vectors)
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    print('%s is saved.' % path)
+
+
+def _manifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def layerNames(path):
+    '''
+    Returns the names of layers in a store
+    '''
+    return list(_manifest(path)['layers'].keys())
+
+
+def loadMask(path):
+    '''
+    Returns the boolean mask of a store
+    '''
+    manifest = _manifest(path)
+    bits = np.load(os.path.join(path, 'mask.npy'))
+    shape = manifest['shape']
+    return np.unpackbits(bits, count=np.prod(shape)).astype(bool).reshape(shape)
+
+
+def loadLayer(path, name, masked=False):
+    '''
+    Loads a layer of a store.
+
+    masked=False returns the full array as a read-only memory map.
+    masked=True returns the vector of masked cells (in the order of
+    array[mask]).
+    '''
+    if masked:
+        with np.load(os.path.join(path, 'masked.npz')) as npz:
+            return npz[name]
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+
+def loadLayers(path, names=None, masked=False):
+    '''
+    Loads layers of a store as a dictionary of name: array
+    '''
+    if names is None:
+        names = [name for name, info in _manifest(path)['layers'].items()
+                 if info['masked'] or not masked]
+    if masked:
+        with np.load(os.path.join(path, 'masked.npz')) as npz:
+            return {name: npz[name] for name in names}
+    return {name: loadLayer(path, name) for name in names}
@@ -12,12 +12,11 @@ import numpy as np
 import gdal
 import fhvuln as fhv
 import pandas as pd
-import rasterio
+import rasterIO as rio
 
 # Load a raster of district IDs
-with rasterio.open(os.path.join('data', 'distid_30s.tif')) as src:
-    did = src.read().squeeze()
-    meta = src.meta.copy()
+fn = os.path.join('data', 'distid_30s.tif')
+did = rio.readRaster(fn); meta = rio.readMeta(fn)
     
 
 #%% Load INEI Census 2017 data
@@ -9,6 +9,7 @@ import os
 import numpy as np
 import gdal
 import fh
+import indicatorStore as store
 import pandas as pd
 
 
@@ -239,8 +240,7 @@ fn = 'data_census'
 data = {'hous':hous,'elec':elec,'watr':watr,'sani':sani,'resi':resi,'depd':depd,
        'disa':disa,'edul':edul,'empl':empl,'occu':occu,'litr':litr,
        'pop':pop,'ypop':ypop,'opop':opop,'vpop':vpop}
-np.save(fn, data)
-print('{}.npy is saved..'.format(fn))
+store.saveStore(fn, data, mask=(code4 != code4[0,0]))
 
 
 
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+'''
+Compact representation of the valid (e.g., in-country) cells of a grid.
+
+The flat indices of valid cells are computed once, and every indicator is kept
+as a contiguous float32 vector over those cells. Vectors are scattered back to
+a 2-D grid only when they are written, into one buffer that is reused for all
+layers.
+
+    - maskIndex(mask)
+    - toVector(grid, mgrid, dtype='float32')
+    - toGrid(vector, mgrid, fill=0, out=None)
+    - writeVectors(layers, mgrid, meta, dtype='float32', nodata=-9999)
+'''
+import numpy as np
+import rasterIO as rio
+
+
+def maskIndex(mask):
+    '''
+    Returns a masked grid {index, shape, buffer} of the True cells of mask
+    '''
+    mask = np.asarray(mask, dtype=bool)
+    return {'index': np.flatnonzero(mask),
+            'shape': mask.shape,
+            'buffer': None}
+
+
+def toVector(grid, mgrid, dtype='float32'):
+    '''
+    Gathers the valid cells of a grid into a contiguous vector
+    '''
+    return np.take(np.ravel(grid), mgrid['index']).astype(dtype, copy=False)
+
+
+def toGrid(vector, mgrid, fill=0, out=None):
+    '''
+    Scatters a vector to a 2-D grid. Unless out is given, the grid is the
+    buffer of the masked grid, which is overwritten by the next call.
+    '''
+    if out is None:
+        if mgrid['buffer'] is None:
+            mgrid['buffer'] = np.empty(mgrid['shape'], dtype='float32')
+        out = mgrid['buffer']
+    out.fill(fill)
+    out.ravel()[mgrid['index']] = vector
+    return out
+
+
+def writeVectors(layers, mgrid, meta, dtype='float32', nodata=-9999):
+    '''
+    Writes vectors as one-band GeoTiffs. Invalid cells are written as NoData.
+
+    layers - dictionary of filename: vector
+    '''
+    rio.writeRasters(((fn, toGrid(vector, mgrid, nodata))
+                      for fn, vector in layers.items()),
+                     meta, dtype, nodata)
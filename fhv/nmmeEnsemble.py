@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+'''
+NMME seasonal forecasts of precipitation aggregated to districts.
+
+All models, initialization months, and ensemble members in a directory are
+found from the file names (e.g., precip_mon_CCSM4_19930401_r1i1p1_199304-199403.nc).
+Each member file (lead months x 1-degree global grid) is averaged to
+districts with a sparse weight matrix of the 1-degree grid, compiled once and
+cached (gridWeights), and member files are read in a thread pool that
+shares the matrix (I/O concurrency, not CPU parallelism).
+Members of all models with the same initialization month form the
+(multi-model) ensemble, reduced to the ensemble mean, spread (standard
+deviation), and probabilities of below- and above-normal precipitation
+(terciles of all hindcast members with the same initialization month) per
+district and lead month.
+
+The NMME grid is south-up with longitude from 0 to 359; fields are flipped to
+north-up, and district polygons are shifted to 0-360 degrees.
+
+    - discoverFiles(path, var='precip')
+    - nmmeGrid(fn)
+    - nmmeWeights(shp_fn, id_col, fn, cache=None, nproc=4)
+    - memberMeans(fn, W, var='PRECIP')
+    - districtMembers(fns, W, var='PRECIP', nproc=4)
+    - ensembleTable(values, files, ids, quantiles=(1/3, 2/3), base=None)
+'''
+import os
+import re
+import glob
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+from netCDF4 import Dataset
+from concurrent.futures import ThreadPoolExecutor
+import gridWeights as gw
+import gridIndex as gi
+
+# e.g., precip_mon_CCSM4_19930401_r1i1p1_199304-199403.nc
+FILE_PATTERN = re.compile(r'(?P<var>[a-z]+)_mon_(?P<model>.+)_(?P<init>\d{8})_'
+                          r'(?P<member>r\d+i\d+p\d+)_(?P<start>\d{6})-(?P<end>\d{6})\.nc$')
+
+
+def discoverFiles(path, var='precip'):
+    '''
+    Returns a DataFrame of NMME member files (fn, model, init, member, nlead)
+    in a directory (searched recursively), sorted by initialization, model,
+    and member
+    '''
+    rows = []
+    for fn in glob.glob(os.path.join(path, '**', '%s_mon_*.nc' % var), recursive=True):
+        match = FILE_PATTERN.match(os.path.basename(fn))
+        if match is None:
+            continue
+        start = pd.Period(match['start'], 'M'); end = pd.Period(match['end'], 'M')
+        rows.append({'fn': fn, 'model': match['model'],
+                     'init': pd.Timestamp(match['init']).to_period('M'),
+                     'member': match['member'], 'nlead': (end - start).n + 1})
+    files = pd.DataFrame(rows, columns=['fn', 'model', 'init', 'member', 'nlead'])
+    return files.sort_values(['init', 'model', 'member']).reset_index(drop=True)
+
+
+def nmmeGrid(fn):
+    '''
+    Returns the north-up grid definition of an NMME file (longitude 0-360)
+    '''
+    with Dataset(fn, 'r') as nc:
+        lat = np.array(nc.variables['LAT']); lon = np.array(nc.variables['LON'])
+    dx, dy = abs(lon[1] - lon[0]), abs(lat[1] - lat[0])
+    extent = [lon.min()-dx/2, lon.max()+dx/2, lat.min()-dy/2, lat.max()+dy/2]
+    return gw.gridFromExtent(extent, dx, dy)
+
+
+def nmmeWeights(shp_fn, id_col, fn, cache=None, nproc=4):
+    '''
+    Returns zone IDs and the (zones x cells) weight matrix of the NMME grid of
+    a member file fn; the matrix is loaded from cache (fn of saveWeights) if
+    it exists, and otherwise compiled and saved there. The grid of fn is
+    registered as 'nmme' (gridIndex) for point lookups.
+    '''
+    grid = nmmeGrid(fn)
+    gi.registerGrid('nmme', grid)
+    if (cache is not None) and os.path.exists(cache + '.npz'):
+        return gw.loadWeights(cache)
+    gdf = gpd.read_file(shp_fn).to_crs(epsg=4326)
+    # Polygons in the western hemisphere to 0-360 degrees
+    polygons = np.asarray(gdf.geometry.values)
+    west = shapely.bounds(polygons)[:,2] < 0
+    polygons[west] = shapely.transform(polygons[west], lambda xy: xy + [360, 0])
+    pieces = gw.gridIntersection(polygons, gdf[id_col].values, grid, nproc)
+    nrow, ncol = grid['shape']
+    ids, W = gw.weightMatrix(pieces.zone, pieces.cell, pieces.area_km2, nrow*ncol)
+    if cache is not None:
+        gw.saveWeights(cache, ids, W)
+    return ids, W
+
+
+def memberMeans(fn, W, var='PRECIP'):
+    '''
+    Returns district means of a member file as a (lead x zones) array
+    '''
+    with Dataset(fn, 'r') as nc:
+        lat = np.array(nc.variables['LAT'])
+        data = nc.variables[var]
+        data.set_auto_mask(False)
+        fill = getattr(data, '_FillValue', None)
+        field = np.asarray(data[:], dtype='float64').reshape(-1, len(lat), data.shape[-1])
+    if fill is not None:
+        field[field == fill] = np.nan
+    if lat[0] < lat[-1]:
+        field = field[:, ::-1]
+    # Column-major cell order of the grid
+    field = field.transpose(0,2,1).reshape(field.shape[0], -1)
+    return gw.zonalMean(W, field)
+
+
+def districtMembers(fns, W, var='PRECIP', nproc=4):
+    '''
+    Returns district means of member files as a (files x lead x zones) array
+    in a thread pool (W is shared, not copied to workers); files with fewer
+    lead months are padded with NaN.
+
+    The threads give I/O concurrency only (overlapping NetCDF reads), not CPU
+    parallelism: decoding and the numpy reductions mostly hold the GIL, so the
+    CPU work of members is not spread over cores.
+    '''
+    with ThreadPoolExecutor(max_workers=nproc) as pool:
+        means = list(pool.map(lambda fn: memberMeans(fn, W, var), fns))
+    nlead = max(m.shape[0] for m in means)
+    values = np.full((len(means), nlead, W.shape[0]), np.nan)
+    for i, m in enumerate(means):
+        values[i, :m.shape[0]] = m
+    return values
+
+
+def ensembleTable(values, files, ids, quantiles=(1/3, 2/3), base=None):
+    '''
+    Reduces district means of members (files x lead x zones, in the order of
+    files) to ensembles of initialization months.
+
+    quantiles - lower and upper quantiles (terciles) of the hindcast members
+                with the same initialization month, per lead and zone
+    base      - optional (first, last) years of the hindcast for quantiles
+
+    Returns a DataFrame of init, lead (0 is the initialization month), target
+    month, zone ID, number of members, ensemble mean and spread, and
+    probabilities below the lower and above the upper quantile.
+    '''
+    init = pd.PeriodIndex(files['init'], freq='M')
+    year, month = np.asarray(init.year), np.asarray(init.month)
+    inbase = np.ones(len(init), dtype=bool) if base is None else \
+             (year >= base[0]) & (year <= base[1])
+    # Hindcast quantiles by initialization month
+    thsd = {m: np.nanquantile(values[(month == m) & inbase], quantiles, axis=0)
+            for m in np.unique(month)}
+    uinit = init.unique()
+    nlead, nzone = values.shape[1:]
+    out = {key: np.full((len(uinit), nlead, nzone), np.nan)
+           for key in ['mean', 'spread', 'below', 'above']}
+    nmem = np.zeros(len(uinit), dtype=int)
+    for i, p in enumerate(uinit):
+        sel = np.asarray(init == p)
+        members = values[sel]; lower, upper = thsd[p.month][0], thsd[p.month][-1]
+        valid = ~np.isnan(members)
+        nvalid = np.maximum(valid.sum(0), 1)
+        nmem[i] = sel.sum()
+        out['mean'][i] = np.nanmean(members, 0)
+        out['spread'][i] = np.nanstd(members, 0)
+        out['below'][i] = (members < lower).sum(0)/nvalid
+        out['above'][i] = (members > upper).sum(0)/nvalid
+    # Long table of (init, lead, zone)
+    ii, ll, zz = np.meshgrid(np.arange(len(uinit)), np.arange(nlead),
+                             np.arange(nzone), indexing='ij')
+    ii, ll, zz = ii.ravel(), ll.ravel(), zz.ravel()
+    table = pd.DataFrame({'init': uinit[ii], 'lead': ll,
+                          'target': pd.PeriodIndex.from_ordinals(uinit.asi8[ii] + ll, freq='M'),
+                          'zone': np.asarray(ids)[zz],
+                          'nmember': nmem[ii]})
+    for key, value in out.items():
+        table[key] = value.ravel()
+    return table.dropna(subset=['mean']).reset_index(drop=True)
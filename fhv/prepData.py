@@ -6,6 +6,8 @@
         - dem/dem_30s_peru_admin.tif
         - data/popu_admin_landscan17.tif
         - data/distid_30s.tif
+        - hydro/glofris_inun_rp_#####.tif (all return periods)
+        - data/traveltime_minsa*.tif (normal, flooded, and additional)
 '''
 import os
 import sys
@@ -13,8 +15,13 @@ import numpy as np
 import pandas as pd
 import geopandas as gpd
 import rasterio
+import rasterio.features
 from rasterio.mask import mask
 import fiona
+import rasterIO as rio
+import gridAlign as ga
+import facilityExposure as fe
+import travelTime as tt
 
 #TODO: function crops raster with shapfile's extent
 #def cropRasterExtent(rst_fn, shp_fn, out_fn):
@@ -28,7 +35,7 @@ def cropRasterShape(rst_fn, shp_fn, out_fn, all_touched=False):
     with fiona.open(shp_fn, 'r') as shapefile:
         geoms = [feature['geometry'] for feature in shapefile]
     # Crop raster including cells over the lines (all_touched)
-    with rasterio.open(rst_fn) as src:
+    with rio.borrowRaster(rst_fn) as src:
         out_image, out_transform = mask(src, geoms, 
                                         crop=True, 
                                         all_touched=all_touched)
@@ -39,9 +46,7 @@ def cropRasterShape(rst_fn, shp_fn, out_fn, all_touched=False):
                      'width': out_image.shape[2],
                      'transform': out_transform})
     # Write the cropped raster
-    with rasterio.open(out_fn, 'w', **out_meta) as dest:
-        dest.write(out_image)
-        print('%s is saved.' % out_fn)
+    rio.writeRaster(out_fn, out_image[0], out_meta)
 
 
 
@@ -54,10 +59,12 @@ cropRasterShape(rst_fn, shp_fn, out_fn, all_touched=False)
 
 
 #%% Crop GLOFRIS inundation with a country shapefile
-rst_fn = '/Users/dlee/data/glofris/inun_dynRout_RP_00010.tif'
+# *All return periods (2, 5, 10, 25, 50, 100, 250, 500, 1000 years)
 shp_fn = '/Users/dlee/data/per/land/admin_ocha_ign/per_admbnda_adm0_2018.shp'
-out_fn = os.path.join('hydro', 'glofris_inun_rp_00010.tif')
-cropRasterShape(rst_fn, shp_fn, out_fn, all_touched=False)
+for rp in [2, 5, 10, 25, 50, 100, 250, 500, 1000]:
+    rst_fn = '/Users/dlee/data/glofris/inun_dynRout_RP_%05d.tif' % rp
+    out_fn = os.path.join('hydro', 'glofris_inun_rp_%05d.tif' % rp)
+    cropRasterShape(rst_fn, shp_fn, out_fn, all_touched=False)
 
 
 #%% Crop LandScan population raster with a country shapeifle
@@ -68,9 +75,8 @@ out_fn = os.path.join('data', 'popu_admin_landscan17.tif')
 cropRasterShape(rst_fn, shp_fn, out_fn, all_touched=False)
 
 # Total population of Peru in 2017 was 31,237,385 (INEI) or 32,165,485 (UNPD)
-with rasterio.open(out_fn) as src: 
-    popu = src.read().squeeze()
-    popu17 = np.sum(popu[popu != popu[0,0]])    # 30,931,229
+popu = rio.readRaster(out_fn)
+popu17 = np.sum(popu[popu != popu[0,0]])        # 30,931,229
 
 # Calibrate population with PER Census data
 #TODO: 
@@ -86,22 +92,38 @@ out_fn = os.path.join('data', 'distid_30s.tif')
 
 # Open the shapefile with GeoPandas
 dist = gpd.read_file(shp_fn)
-# Open the raster file as a template for feature burning using rasterio
-rst = rasterio.open(rst_fn)
-# Copy and update the metadata frm the input raster for the output
-meta = rst.meta.copy()
-meta.update(dtype=rasterio.int32)
+# Use the raster file as a template for feature burning
+meta = rio.readMeta(rst_fn)
 # Before burning it, we need to 
 dist = dist.assign(IDDIST_int = dist.IDDIST.values.astype(rasterio.int32))
 # Burn the features into the raster and write it out
-with rasterio.open(out_fn, 'w+', **meta) as out:
-    out_arr = out.read(1)
-    shapes = ((geom, value) for geom, value in zip(dist.geometry, dist.IDDIST_int))
-    burned = rasterio.features.rasterize(shapes=shapes, fill=0, out=out_arr, 
-                                         transform=out.transform,
-                                         all_touched=False)
-    out.write_band(1, burned)
-    print('%s is saved' % out_fn)
+shapes = ((geom, value) for geom, value in zip(dist.geometry, dist.IDDIST_int))
+burned = rasterio.features.rasterize(shapes=shapes, fill=0, 
+                                     out_shape=(meta['height'], meta['width']),
+                                     transform=meta['transform'],
+                                     all_touched=False, dtype=rasterio.int32)
+rio.writeRaster(out_fn, burned, meta, 'int32')
+
+
+#%% Travel time to health facilities (normal and flooded)
+# *Friction from land cover (walking speed per class in tScenario.xlsx), and
+#  cells flooded deeper than 1 meter (GLOFRIS 10-year) are impassable.
+grid = ga.gridFromRaster(os.path.join('data', 'distid_30s.tif'))
+meta = rio.readMeta(os.path.join('data', 'distid_30s.tif'))
+lcov = ga.alignRaster(os.path.join('data', 'aligned', 'raw', 'landcover_peru.tif'), grid)
+depth = ga.alignRaster(os.path.join('hydro', 'glofris_inun_rp_00010.tif'), grid,
+                       dtype='float64', nodata=0)
+friction = tt.frictionFromLandCover(lcov, tt.landCoverSpeed())
+facIdx = fe.facilityIndex(fe.MINSA_FN, grid)
+sources = np.ravel_multi_index((facIdx['row'][facIdx['inside']],
+                                facIdx['col'][facIdx['inside']]), grid['shape'])
+tnorm, (tflod,) = tt.floodTravelTimes(friction, grid, sources, [depth], 1, nproc=2)
+tadd = tt.additionalTime(tnorm, tflod)
+nodata = (rio.readRaster(os.path.join('data', 'distid_30s.tif')) == 0)
+rio.writeRasters({os.path.join('data', 'traveltime_minsa.tif'): np.where(np.isinf(tnorm), np.nan, tnorm),
+                  os.path.join('data', 'traveltime_minsa_rp00010.tif'): np.where(np.isinf(tflod), np.nan, tflod),
+                  os.path.join('data', 'traveltime_minsa_add_rp00010.tif'): tadd},
+                 meta, 'float32', -9999, mask=nodata)
 
 
 
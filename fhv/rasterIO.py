@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+'''
+Shared raster I/O used by the FHV scripts.
+
+Datasets are opened once and kept in a small pool of handles, reads can be
+windowed, and writes of many layers on the same grid share one profile and
+one output buffer. Handles in use (borrowRaster) are reference-counted and
+only idle handles are closed when the pool is full; writing a file closes its
+pooled handle first. NoData is handled the same way everywhere: on read,
+source NoData cells can be replaced by a given value; on write, masked cells
+(and NaN of float inputs) are set to the output NoData. Bytes read and written
+are counted in ioStats, with a log of the last LOG_SIZE calls.
+
+    - openRaster(fn)
+    - borrowRaster(fn)
+    - readMeta(fn)
+    - readRaster(fn, band=1, window=None, dtype=None, nodata=None)
+    - iterWindows(fn, band=1, nrow=None, dtype=None, nodata=None)
+    - writeRaster(fn, data, meta, dtype=None, nodata=None, mask=None)
+    - writeRasters(layers, meta, dtype='float32', nodata=-9999, mask=None)
+'''
+import os
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+# Pool of open dataset handles (least recently used idle handle is closed first)
+POOL_SIZE = 32
+_pool = OrderedDict()
+_refs = {}
+_lock = threading.Lock()
+
+# Bytes read/written and a log of the last (operation, filename, bytes) calls
+LOG_SIZE = 1000
+ioStats = {'read': 0, 'write': 0, 'log': deque(maxlen=LOG_SIZE)}
+verbose = False
+
+
+def _record(op, fn, nbytes):
+    ioStats[op] += nbytes
+    ioStats['log'].append((op, fn, nbytes))
+    if verbose:
+        print('{} {:>12,d} bytes: {}'.format(op, nbytes, fn))
+
+
+def resetStats():
+    '''
+    Resets the I/O counters
+    '''
+    ioStats['read'] = 0; ioStats['write'] = 0; ioStats['log'].clear()
+
+
+def _trimPool():
+    # Closes least recently used idle handles beyond POOL_SIZE (under _lock)
+    for key in list(_pool.keys()):
+        if len(_pool) <= POOL_SIZE:
+            break
+        if _refs.get(key, 0) == 0:
+            _pool.pop(key).close()
+
+
+def openRaster(fn):
+    '''
+    Returns a pooled read-only dataset handle. The handle is never closed here;
+    use borrowRaster to keep it from being closed by other threads while in use.
+    '''
+    key = os.path.abspath(fn)
+    with _lock:
+        if key not in _pool:
+            _pool[key] = rasterio.open(fn)
+        _pool.move_to_end(key)
+        return _pool[key]
+
+
+@contextmanager
+def borrowRaster(fn):
+    '''
+    Context manager of a pooled dataset handle that is not closed while in use
+    '''
+    key = os.path.abspath(fn)
+    with _lock:
+        if key not in _pool:
+            _pool[key] = rasterio.open(fn)
+        _pool.move_to_end(key)
+        _refs[key] = _refs.get(key, 0) + 1
+        src = _pool[key]
+    try:
+        yield src
+    finally:
+        with _lock:
+            _refs[key] -= 1
+            if _refs[key] == 0:
+                del _refs[key]
+            _trimPool()
+
+
+def _evict(fn):
+    # Closes the pooled handle of a file before it is written
+    key = os.path.abspath(fn)
+    with _lock:
+        src = _pool.pop(key, None)
+        _refs.pop(key, None)
+    if src is not None:
+        src.close()
+
+
+def closeRasters():
+    '''
+    Closes all pooled dataset handles
+    '''
+    with _lock:
+        while _pool:
+            _, src = _pool.popitem()
+            src.close()
+        _refs.clear()
+
+
+def readMeta(fn):
+    '''
+    Returns a copy of the raster profile (driver, crs, transform, shape, ...)
+    '''
+    with borrowRaster(fn) as src:
+        return src.profile.copy()
+
+
+def readRaster(fn, band=1, window=None, dtype=None, nodata=None):
+    '''
+    Reads a band of a raster (optionally a window of it).
+
+    dtype  - output data type (default: source data type)
+    nodata - if given, source NoData cells are replaced by this value
+    '''
+    with borrowRaster(fn) as src:
+        data = src.read(band, window=window)
+        srcNodata = src.nodata
+    if dtype is not None:
+        data = data.astype(dtype, copy=False)
+    if (nodata is not None) and (srcNodata is not None):
+        if np.isnan(srcNodata):
+            data[np.isnan(data)] = nodata
+        else:
+            data[data == srcNodata] = nodata
+    _record('read', fn, data.nbytes)
+    return data
+
+
+def iterWindows(fn, band=1, nrow=None, dtype=None, nodata=None):
+    '''
+    Yields (window, data) over strips of rows so that a raster larger than
+    memory can be processed lazily. By default a strip is a block row.
+    '''
+    with borrowRaster(fn) as src:
+        if nrow is None:
+            nrow = src.block_shapes[band-1][0]
+        height, width = src.height, src.width
+    for row in range(0, height, nrow):
+        window = Window(0, row, width, min(nrow, height - row))
+        yield window, readRaster(fn, band, window, dtype, nodata)
+
+
+def _profile(meta, dtype, nodata):
+    profile = meta.copy()
+    profile.update(driver='GTiff', count=1, dtype=np.dtype(dtype).name,
+                   nodata=nodata, compress='lzw')
+    return profile
+
+
+def _write(fn, data, profile, buffer, mask):
+    np.copyto(buffer, data, casting='unsafe')
+    if buffer.dtype.kind == 'f':
+        buffer[np.isnan(buffer)] = profile['nodata']
+    if mask is not None:
+        buffer[mask] = profile['nodata']
+    _evict(fn)
+    with rasterio.open(fn, 'w', **profile) as dst:
+        dst.write(buffer, 1)
+    _record('write', fn, buffer.nbytes)
+    print('%s is saved.' % fn)
+
+
+def writeRaster(fn, data, meta, dtype=None, nodata=None, mask=None):
+    '''
+    Writes a one-band GeoTiff without changing the input array.
+
+    meta   - profile of the grid (e.g., from readMeta)
+    mask   - boolean array of cells to be written as NoData
+    '''
+    dtype = data.dtype if dtype is None else dtype
+    nodata = meta.get('nodata') if nodata is None else nodata
+    profile = _profile(meta, dtype, nodata)
+    buffer = np.empty(data.shape, dtype=dtype)
+    _write(fn, data, profile, buffer, mask)
+
+
+def writeRasters(layers, meta, dtype='float32', nodata=-9999, mask=None):
+    '''
+    Writes multiple one-band GeoTiffs on the same grid in a batch.
+
+    layers - dictionary (or iterable of pairs) of filename: array
+    '''
+    profile = _profile(meta, dtype, nodata)
+    buffer = np.empty((profile['height'], profile['width']), dtype=dtype)
+    items = layers.items() if isinstance(layers, dict) else layers
+    for fn, data in items:
+        _write(fn, data, profile, buffer, mask)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+'''
+Batch scenarios of the FHV and flood/health risk assessment (Bangladesh).
+
+Inputs of compRisk_bgd.py (indicator matrix, flood depths of all return
+periods, population, facility depths, and travel-time changes) are loaded
+once as read-only vectors over in-country cells. A scenario is a small
+configuration (weights, thresholds, FHV zones, return period, population
+source) evaluated against the shared inputs, and many scenarios are run in a
+thread pool (the matrix products and reductions release the GIL) into one
+results table.
+
+    - loadInputs(rps=RETURN_PERIODS, popu_fns=POPU_FNS)
+    - scenarioGrid(**options)
+    - runScenario(inputs, config)
+    - runScenarios(inputs, configs, nthread=4)
+'''
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import rasterIO as rio
+import indicatorStore as store
+import maskedGrid as mg
+import compositeIndex as ci
+import gridAlign as ga
+import floodRisk as fr
+import depthDamage as dd
+import facilityExposure as fe
+
+# Indicators in the column order of the data matrix (leaves of the FHV tree,
+# as in compRisk_bgd.py)
+NAMES = ci.leafIndicators(ci.FHV_TREE, 'fhv')
+# Flood-dependent (dynamic) indicators
+FLOOD_NAMES = ['fdep', 'aphc', 'ahsp']
+
+# Population sources (scaled to the 2015 World Bank population)
+POPU_FNS = {'landscan': os.path.join('socioecon', 'population_landscan', 'lspop_bgd.tif')}
+POPU_2015 = 161200886
+# GDP/PPP per capita 2015 (BGD) in 2011 constant international USD
+GDP_PER_CAPITA = 3132.57
+
+DEFAULT_SCENARIO = {
+    'weights': None,        # None (initial weights) or {name: weight} changes
+    'flood': True,          # include flood-dependent indicators
+    'zoneLow': 0.4,         # Low-FHV zone (fhv < zoneLow)
+    'zoneHigh': 0.6,        # High-FHV zone (fhv >= zoneHigh)
+    'rp': 10,               # return period of GLOFRIS flood depth
+    'popu': 'landscan',     # population source
+    'thsd': 20,             # depth of fully affected population (dm)
+    'thsdGdp': 30,          # depth of fully affected GDP (dm)
+    'thsdFacl': 15,         # depth of fully affected facilities (dm)
+    'thsdAtt': 60,          # additional travel time of affected population (min)
+}
+
+
+def _readOnly(array):
+    array = np.ascontiguousarray(array)
+    array.setflags(write=False)
+    return array
+
+
+def loadInputs(rps=fr.RETURN_PERIODS, popu_fns=POPU_FNS):
+    '''
+    Loads all inputs once and returns them as a dictionary of read-only
+    vectors over in-country (Yes-code) cells
+    '''
+    fn = os.path.join('land', 'boundary_gadm', 'gadm4_code.tif')
+    code4 = rio.readRaster(fn)
+    grid = ga.gridFromRaster(fn)
+    nc = (code4 == code4[0,0])
+    ycg = mg.maskIndex(~nc)
+    # Indicator matrix (stores masked by the same Yes-code cells)
+    for path in ['data_census', 'data_indices']:
+        assert np.array_equal(store.loadMask(path), ~nc), \
+            '%s is not masked by the Yes-code cells; rebuild the store.' % path
+    layers = store.loadLayers('data_census', masked=True)
+    layers.update(store.loadLayers('data_indices', masked=True))
+    data = np.array([layers[name] for name in NAMES], dtype='float32').T
+    df = pd.ExcelFile('initial_weights.xlsx').parse('weight')
+    weight = df.set_index('name').weight.reindex(NAMES).values
+    assert not np.isnan(weight).any(), 'initial_weights.xlsx misses indicators.'
+    # Flood depths of all return periods (return periods x cells)
+    loc = os.path.join('hydrology', 'inundation_glofris')
+    stack = ga.alignStack([os.path.join(loc, 'rp_%05d.tif' % rp) for rp in rps],
+                          grid, dtype='float32', nodata=0)
+    depth = stack.reshape(len(rps), -1)[:,ycg['index']]
+    # Facility depths of all return periods (return periods x facilities)
+    fn = os.path.join('health', 'healthsites_lged', '%s_rp00010.shp')
+    # *Facilities on out-of-country cells take zero depth (as depth[nc] = 0)
+    facl = {name: _readOnly(fe.sampleDepth(stack, fe.facilityIndex(fn % name, grid), mask=nc))
+            for name in ['family', 'hospital']}
+    # Population sources
+    popu = {}
+    for name, fn in popu_fns.items():
+        value = rio.readRaster(fn, dtype='float64')
+        value[(value == value.min()) | nc] = 0
+        popu[name] = _readOnly(mg.toVector(value/value.sum()*POPU_2015, ycg, 'float64'))
+    # Additional travel times (GLOFRIS 10-year)
+    att = {}
+    for name in ['aphc', 'ahsp']:
+        value = rio.readRaster(os.path.join('health', 'traveltime_lged', name+'.tif'),
+                               dtype='float')
+        value[nc | (value < 0)] = 0
+        att[name] = _readOnly(mg.toVector(value, ycg, 'float64'))
+    return {'data': _readOnly(data), 'weight': _readOnly(weight),
+            'rps': list(rps), 'depth': _readOnly(depth), 'facl': facl,
+            'popu': popu, 'att': att, 'ncell': len(ycg['index'])}
+
+
+def scenarioGrid(**options):
+    '''
+    Returns scenario configs of all combinations of the options
+    (e.g., scenarioGrid(thsd=[10, 20, 30], rp=[10, 100]))
+    '''
+    keys = list(options.keys())
+    return [dict(zip(keys, values))
+            for values in itertools.product(*[options[k] for k in keys])]
+
+
+def runScenario(inputs, config):
+    '''
+    Evaluates a scenario (config updates DEFAULT_SCENARIO) and returns a
+    dictionary of the configuration and results
+    '''
+    conf = dict(DEFAULT_SCENARIO, **config)
+    # FHV index with scenario weights
+    weight = np.array(inputs['weight'], dtype='float64')
+    for name, value in (conf['weights'] or {}).items():
+        weight[NAMES.index(name)] = value
+    if not conf['flood']:
+        weight[[NAMES.index(name) for name in FLOOD_NAMES]] = 0
+    nodes, W = ci.blockWeights(ci.FHV_TREE, NAMES, weight, ['fhv'])
+    fhv = ci.evaluateComposite(inputs['data'], nodes, W)['fhv']
+    hzon, lzon = (fhv >= conf['zoneHigh']), (fhv < conf['zoneLow'])
+    # Flood and health risk
+    irp = inputs['rps'].index(conf['rp'])
+    depth, popu = inputs['depth'][irp], inputs['popu'][conf['popu']]
+    ratio = dd.damageRatio(depth, conf['thsd'])
+    popuAfft = ratio @ popu
+    gdpAfft = dd.damageRatio(depth, conf['thsdGdp'], out=ratio) @ popu*GDP_PER_CAPITA
+    result = {'popuTotl': popu.sum(),
+              'popuAfft': popuAfft,
+              'gdpAfft': gdpAfft,
+              'popuHzon': popu[hzon].sum(),
+              'popuLzon': popu[lzon].sum(),
+              'areaHzon': hzon.mean()*100,
+              'phcAfft': dd.affectedCount(inputs['facl']['family'][irp], conf['thsdFacl']),
+              'hspAfft': dd.affectedCount(inputs['facl']['hospital'][irp], conf['thsdFacl']),
+              'popuAttPhc': popu[inputs['att']['aphc'] >= conf['thsdAtt']].sum(),
+              'popuAttHsp': popu[inputs['att']['ahsp'] >= conf['thsdAtt']].sum(),
+              'fhvMean': fhv.mean()}
+    conf['weights'] = str(conf['weights'])
+    return dict(conf, **result)
+
+
+def runScenarios(inputs, configs, nthread=4):
+    '''
+    Evaluates scenarios in a thread pool against the shared inputs and returns
+    a DataFrame with one row per scenario
+    '''
+    with ThreadPoolExecutor(max_workers=nthread) as pool:
+        rows = list(pool.map(lambda config: runScenario(inputs, config), configs))
+    table = pd.DataFrame(rows)
+    table.index.name = 'scenario'
+    return table
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+'''
+Seasonal and climatology aggregation of daily (time x cells) PISCO arrays.
+
+Days of the selected months are grouped into periods (years or months of each
+year) and reduced with segment sums (np.add.reduceat over the boundaries of
+runs of days), directly on the daily array without copying the selected days
+or looping over years. A season across the new year (e.g., months=(12,1,2))
+belongs to the year of its last month. Climatologies exclude years (e.g.,
+El Nino years 1983 and 1998), and event years and anomalies of all periods
+are returned with them for all cells at once.
+
+For example, the statistics of the cluster notebook are
+    stat = climatology(prcp, tim, months=(1,2,3), by='month', events=[2017])
+    p28s1, p28s2, p28s3 = stat['clim']          (monthly sums)
+    p17s1, p17s2, p17s3 = stat['events'][2017]
+and how='mean' gives the averaged daily rainfall (p28m*, p17m*).
+
+    - periodKeys(dates, months=None, by='year')
+    - aggregate(data, dates, months=None, by='year')
+    - climatology(data, dates, months=(1,2,3), by='year', how='sum',
+                  base=(1981, 2010), exclude=(1983, 1998), events=())
+'''
+import numpy as np
+import pandas as pd
+
+
+def periodKeys(dates, months=None, by='year'):
+    '''
+    Returns the period key of every day (year, or year*100 + month if
+    by='month') and a flag of days in the selected months
+    '''
+    dates = pd.DatetimeIndex(dates)
+    year, month = np.asarray(dates.year), np.asarray(dates.month)
+    if months is None:
+        sel = np.ones(len(dates), dtype=bool)
+    else:
+        months = list(months)
+        sel = np.isin(month, months)
+        # Months before the wrap of the season belong to the next year
+        wrap = np.flatnonzero(np.diff(months) < 0)
+        if len(wrap) > 0:
+            year = year + np.isin(month, months[:wrap[0]+1])
+    if by == 'month':
+        return year*100 + month, sel
+    elif by == 'year':
+        return year, sel
+    else:
+        raise ValueError('by must be "year" or "month".')
+
+
+def _segmentSum(data, start, end):
+    # Sums of data[start:end] along the first axis for all segments
+    index = np.column_stack((start, end)).ravel()
+    if index[-1] == data.shape[0]:
+        index = index[:-1]
+    return np.add.reduceat(data, index, axis=0)[::2]
+
+
+def aggregate(data, dates, months=None, by='year'):
+    '''
+    Aggregates a daily (time x cells) array by periods.
+
+    Returns a dictionary of period keys, year and month (0 if by='year') of
+    periods, number of days (ndays), and (periods x cells) sums (total) and
+    counts (count) of valid (non-NaN) days.
+    '''
+    data = np.asarray(data)
+    key, sel = periodKeys(dates, months, by)
+    # Runs of consecutive selected days of the same period
+    mark = np.where(sel, key, -1)
+    bound = np.r_[0, np.flatnonzero(np.diff(mark) != 0) + 1, len(mark)]
+    start, end = bound[:-1], bound[1:]
+    keep = sel[start]
+    start, end = start[keep], end[keep]
+    nan = np.isnan(data)
+    if nan.any():
+        total = _segmentSum(np.where(nan, 0, data), start, end)
+        count = (end - start)[:,None] - _segmentSum(nan, start, end)
+    else:
+        total = _segmentSum(data, start, end)
+        count = np.broadcast_to((end - start)[:,None], total.shape)
+    # Runs of the same period (e.g., months=(1,3)) are merged
+    rkey = key[start]
+    first = np.flatnonzero(np.r_[True, rkey[1:] != rkey[:-1]])
+    if len(first) < len(rkey):
+        total = np.add.reduceat(total, first, axis=0)
+        count = np.add.reduceat(count, first, axis=0)
+        ndays = np.add.reduceat(end - start, first)
+    else:
+        ndays = end - start
+    pkey = rkey[first]
+    year, month = (pkey // 100, pkey % 100) if by == 'month' else (pkey, np.zeros_like(pkey))
+    return {'period': pkey, 'year': year, 'month': month, 'ndays': ndays,
+            'total': total, 'count': np.asarray(count)}
+
+
+def climatology(data, dates, months=(1,2,3), by='year', how='sum',
+                base=(1981, 2010), exclude=(1983, 1998), events=()):
+    '''
+    Climatology, event-year values, and anomalies of seasonal (by='year') or
+    monthly (by='month') totals (how='sum') or daily means (how='mean').
+
+    base    - first and last years of the climatology
+    exclude - years excluded from the climatology
+    events  - years of which values are returned
+
+    Returns a dictionary of the aggregate (see aggregate), values and
+    anomalies of all periods (periods x cells), the climatology (one row per
+    month if by='month'), and {year: values} of event years.
+    '''
+    agg = aggregate(data, dates, months, by)
+    if how == 'sum':
+        value = np.where(agg['count'] > 0, agg['total'], np.nan)
+    elif how == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            value = agg['total']/agg['count']
+    else:
+        raise ValueError('how must be "sum" or "mean".')
+    year, month = agg['year'], agg['month']
+    inbase = (year >= base[0]) & (year <= base[1]) & ~np.isin(year, exclude)
+    groups = np.unique(month)
+    group = np.searchsorted(groups, month)
+    clim = np.full((len(groups), value.shape[1]), np.nan)
+    for g in range(len(groups)):
+        sub = value[inbase & (group == g)]
+        valid = (~np.isnan(sub)).sum(0)
+        ok = valid > 0
+        clim[g, ok] = np.nansum(sub[:, ok], 0)/valid[ok]
+    return dict(agg, value=value, clim=clim, anomaly=value - clim[group],
+                events={yr: value[year == yr] for yr in events})
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+'''
+Monte Carlo sensitivity of a composite index to its weights.
+
+Random weights are drawn in blocks of trials and evaluated as one
+(cells x indicators) @ (indicators x trials) product per block. Scores are
+binned with integer arithmetic (floor(score*nbin)) and counted per cell with
+np.bincount, so no per-bin comparisons over the full vector are needed. The
+block size is bounded by a memory budget, and the result is reproducible
+for a given seed.
+
+Long runs are sharded into chunks of trials with independent seed streams,
+so that the merged int32 counters can be checkpointed after every finished
+chunk and a killed run resumes from the completed chunks; results are keyed
+by a hash of the data and the configuration, so a stale result is never
+reused. Sharding is for checkpointing, not for CPU parallelism: chunks run in
+the calling process (optionally in threads, which overlap only the matrix
+products, as binning holds the GIL), and no worker process re-imports the
+calling script.
+
+Random weights are either normalized uniform draws ('uniform', as in the
+original analysis) or Dirichlet draws ('dirichlet', uniform on the simplex).
+For per-indicator attribution, one-at-a-time perturbations around a baseline
+and Sobol first-order and total-order indices (Saltelli/Jansen estimators)
+are evaluated on the same batched matrix products.
+
+    - randomWeights(rng, nind, ntrial, scheme='uniform')
+    - blockSize(ncell, itemsize, memory=2**28)
+    - weightFrequency(data, ntrial, nbin=20, seed=None, memory=2**28, ...)
+    - runHash(data, config)
+    - runSensitivity(data, ntrial, path, nbin=20, seed=0, chunk=500, nproc=1, ...)
+    - oatWeights(base, factors)
+    - oatSensitivity(data, base, factors, nbin=20, memory=2**28)
+    - sobolIndices(data, nsample=1024, seed=None, memory=2**28)
+'''
+import os
+import json
+import hashlib
+import numpy as np
+from scipy.stats import qmc
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+OAT_FACTORS = (-0.5, -0.25, 0.25, 0.5)
+
+
+def randomWeights(rng, nind, ntrial, scheme='uniform'):
+    '''
+    Returns (nind x ntrial) random weights, each column scaled to 1.
+    
+    scheme - 'uniform' (normalized uniform draws) or 'dirichlet' (flat 
+             Dirichlet, i.e., uniform on the simplex)
+    '''
+    # Drawn trial by trial, so that results do not depend on the block size
+    if scheme == 'uniform':
+        weight = rng.random((ntrial, nind)).T
+    elif scheme == 'dirichlet':
+        weight = rng.dirichlet(np.ones(nind), ntrial).T
+    else:
+        raise ValueError('scheme should be either "uniform" or "dirichlet".')
+    return weight/weight.sum(0)
+
+
+def blockSize(ncell, itemsize, memory=2**28):
+    '''
+    Number of trials per block that keeps the temporaries within memory bytes
+    (scores and flat bin indices per cell and trial)
+    '''
+    return int(max(1, memory // (ncell*(itemsize + 8))))
+
+
+def binCounts(score, nbin, out):
+    '''
+    Adds counts of (cells x trials) scores in nbin bins of [0, 1) to the
+    (cells x nbin) counter out
+    '''
+    ncell = score.shape[0]
+    # Scores out of [0, 1) (or NaN) are counted in an extra bin which is dropped
+    ibin = np.floor(score*nbin, out=score*nbin)
+    ibin[~((ibin >= 0) & (ibin <= nbin))] = nbin
+    ibin = ibin.astype(np.int64)
+    ibin += (np.arange(ncell, dtype=np.int64)*(nbin+1))[:,None]
+    count = np.bincount(ibin.ravel(), minlength=ncell*(nbin+1))
+    out += count.reshape(ncell, nbin+1)[:,:nbin].astype(out.dtype)
+    return out
+
+
+def weightFrequency(data, ntrial, nbin=20, seed=None, memory=2**28,
+                    scheme='uniform', verbose=True):
+    '''
+    Returns (cells x nbin) int32 frequencies of the index value in each bin
+    over ntrial sets of random weights.
+
+    data   - (cells x indicators) matrix of indicators (0-1)
+    seed   - seed (or numpy Generator) of random weights
+    memory - memory budget (bytes) of a block of trials
+    scheme - sampling scheme of random weights (see randomWeights)
+    verbose - if True, prints the progress of every block
+    '''
+    rng = np.random.default_rng(seed)
+    ncell, nind = data.shape
+    freq = np.zeros((ncell, nbin), dtype='int32')
+    block = blockSize(ncell, data.dtype.itemsize, memory)
+    for start in range(0, ntrial, block):
+        n = min(block, ntrial - start)
+        weight = randomWeights(rng, nind, n, scheme).astype(data.dtype)
+        binCounts(data @ weight, nbin, freq)
+        if verbose:
+            print('{}/{} ({:02.1f}%)'.format(start+n, ntrial, (start+n)/ntrial*100))
+    return freq
+
+
+def runHash(data, config):
+    '''
+    Hash of the data matrix and the run configuration
+    '''
+    h = hashlib.sha1()
+    h.update(str((data.shape, data.dtype.str)).encode())
+    h.update(np.ascontiguousarray(data).view(np.uint8))
+    h.update(json.dumps(config, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def _runChunk(data, k, ntrial, nbin, seed, memory, scheme):
+    # Chunk k uses its own stream spawned from the seed (progress is printed
+    # per chunk by runSensitivity, not per block)
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(k,)))
+    return k, weightFrequency(data, ntrial, nbin, rng, memory, scheme, verbose=False)
+
+
+def _saveAtomic(fn, **kwargs):
+    np.savez(fn + '.tmp.npz', **kwargs)
+    os.replace(fn + '.tmp.npz', fn)
+
+
+def runSensitivity(data, ntrial, path, nbin=20, seed=0, chunk=500,
+                   nproc=1, memory=2**28, scheme='uniform'):
+    '''
+    Runs (or resumes, or loads) weightFrequency sharded into chunks.
+
+    path   - directory of results and checkpoints
+    seed   - integer seed; chunk k of trials uses the stream (seed, k), so the
+             result does not depend on nproc
+    chunk  - number of trials per task (the counters are checkpointed after
+             every finished chunk)
+    nproc  - number of threads; threads overlap only the matrix products
+             (binning holds the GIL), so more than one gives little speedup
+    scheme - sampling scheme of random weights (see randomWeights)
+
+    Results are saved as <path>/<hash>.npz with the configuration, where the
+    hash covers the data and the configuration.
+    '''
+    config = {'ntrial': int(ntrial), 'nbin': int(nbin), 'seed': int(seed),
+              'chunk': int(chunk), 'weights': scheme}
+    key = runHash(data, config)
+    os.makedirs(path, exist_ok=True)
+    out_fn = os.path.join(path, key + '.npz')
+    ckpt_fn = os.path.join(path, key + '.ckpt.npz')
+    if os.path.isfile(out_fn):
+        with np.load(out_fn) as out:
+            return out['freq']
+
+    # Resume from a checkpoint
+    nchunk = int(np.ceil(ntrial/chunk))
+    if os.path.isfile(ckpt_fn):
+        with np.load(ckpt_fn) as ckpt:
+            freq, done = ckpt['freq'], set(ckpt['done'].tolist())
+        print('Resuming %s (%d/%d chunks done).' % (key, len(done), nchunk))
+    else:
+        freq, done = np.zeros((data.shape[0], nbin), dtype='int32'), set()
+    todo = [k for k in range(nchunk) if k not in done]
+
+    # Run remaining chunks against the shared data matrix
+    if todo:
+        with ThreadPoolExecutor(max_workers=nproc) as pool:
+            jobs = [pool.submit(_runChunk, data, k,
+                                min(chunk, ntrial - k*chunk), nbin, seed, memory,
+                                scheme)
+                    for k in todo]
+            for job in as_completed(jobs):
+                k, part = job.result()
+                freq += part; done.add(k)
+                print('Chunk {}/{} is done.'.format(len(done), nchunk))
+                if len(done) < nchunk:
+                    _saveAtomic(ckpt_fn, freq=freq, done=sorted(done))
+
+    _saveAtomic(out_fn, freq=freq, config=json.dumps(config))
+    if os.path.isfile(ckpt_fn):
+        os.remove(ckpt_fn)
+    print('%s is saved.' % out_fn)
+    return freq
+
+
+def oatWeights(base, factors=OAT_FACTORS):
+    '''
+    Returns (nind x nind*nfactor) one-at-a-time weights around the baseline.
+    Column i*nfactor+j scales weight i by (1+factors[j]) and rescales the
+    other weights proportionally (equally, if they are all zero), so that
+    every column sums to 1.
+    '''
+    base = np.asarray(base, dtype='float64'); base = base/base.sum()
+    nind, nfac = len(base), len(factors)
+    weight = np.repeat(base[:,None], nind*nfac, axis=1)
+    for i in range(nind):
+        for j, f in enumerate(factors):
+            col = weight[:,i*nfac+j]
+            wi = min(base[i]*(1+f), 1)
+            if base[i] < 1:
+                col *= (1 - wi)/(1 - base[i])
+            else:
+                # All other weights are zero: the rest is shared equally
+                col[:] = (1 - wi)/max(nind - 1, 1)
+            col[i] = wi
+    return weight
+
+
+def oatSensitivity(data, base, factors=OAT_FACTORS, nbin=20, memory=2**28):
+    '''
+    One-at-a-time sensitivity around the baseline weights.
+
+    Returns two (nind x nfactor) arrays: the mean absolute change of the index
+    over cells, and the fraction of cells whose bin (of nbin) changes.
+    '''
+    nind, nfac = len(base), len(factors)
+    weight = oatWeights(base, factors).astype(data.dtype)
+    score0 = data @ (np.asarray(base)/np.sum(base)).astype(data.dtype)
+    bin0 = np.floor(score0*nbin)[:,None]
+    mchange = np.zeros(nind*nfac); bchange = np.zeros(nind*nfac)
+    block = blockSize(data.shape[0], data.dtype.itemsize, memory)
+    for start in range(0, nind*nfac, block):
+        end = min(start + block, nind*nfac)
+        score = data @ weight[:,start:end]
+        mchange[start:end] = np.abs(score - score0[:,None]).mean(0)
+        bchange[start:end] = (np.floor(score*nbin) != bin0).mean(0)
+    return mchange.reshape(nind, nfac), bchange.reshape(nind, nfac)
+
+
+def sobolIndices(data, nsample=1024, seed=None, memory=2**28):
+    '''
+    Variance-based sensitivity of the index to each indicator weight, for every
+    cell. Raw weights are independent U(0,1) scaled to 1 (as in the Monte Carlo
+    analysis), sampled with a scrambled Sobol sequence (nsample is rounded up
+    to a power of 2).
+
+    Returns (S1, ST), the first-order (Saltelli 2010) and total-order (Jansen)
+    indices, as (cells x indicators) float32 arrays. Each block of samples is
+    evaluated in one matrix product over the A, B, and AB_i weight sets.
+    '''
+    ncell, nind = data.shape
+    sampler = qmc.Sobol(2*nind, scramble=True, seed=np.random.default_rng(seed))
+    AB = sampler.random_base2(int(np.ceil(np.log2(nsample))))
+    A, B = AB[:,:nind], AB[:,nind:]
+    N = len(A)
+    sumY = np.zeros(ncell); sumY2 = np.zeros(ncell)
+    s1 = np.zeros((ncell, nind)); st = np.zeros((ncell, nind))
+    # Bytes per cell and sample: scores of the nind+2 weight sets (data type
+    # and float64 copy), and the float64 yAB-yA and squared temporaries
+    block = int(max(1, memory // (ncell*((nind + 2)*(data.dtype.itemsize + 8) +
+                                         2*nind*8))))
+    for start in range(0, N, block):
+        a, b = A[start:start+block], B[start:start+block]
+        n = len(a)
+        # Weight sets: A, B, and AB_i (A with column i from B) for all i
+        abi = np.repeat(a[None,:,:], nind, axis=0)
+        abi[np.arange(nind),:,np.arange(nind)] = b.T
+        weight = np.concatenate((a, b, abi.reshape(-1, nind)), axis=0).T
+        weight = (weight/weight.sum(0)).astype(data.dtype)
+        score = (data @ weight).astype('float64')
+        yA, yB = score[:,:n], score[:,n:2*n]
+        yAB = score[:,2*n:].reshape(ncell, nind, n)
+        sumY += yA.sum(1) + yB.sum(1)
+        sumY2 += (yA**2).sum(1) + (yB**2).sum(1)
+        s1 += np.einsum('ck,cik->ci', yB, yAB - yA[:,None,:])
+        st += ((yA[:,None,:] - yAB)**2).sum(2)
+        print('{}/{} ({:02.1f}%)'.format(start+n, N, (start+n)/N*100))
+    var = sumY2/(2*N) - (sumY/(2*N))**2
+    var[var <= 0] = np.nan
+    S1 = (s1/N)/var[:,None]
+    ST = (st/(2*N))/var[:,None]
+    return S1.astype('float32'), ST.astype('float32')
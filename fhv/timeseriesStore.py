@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+'''
+Time-contiguous store of daily PISCO for fast per-cell extraction.
+
+A (time, lat, lon) cube is rechunked once into spatial blocks of cells by the
+full record: each block is a (cells x time) .npy file, so the whole daily
+series of a cell is one contiguous read, and extracting 40 years of rainfall
+for a few clusters or stations reads only the blocks that hold them (memory
+mapped). Blocks are square tiles of the grid. The store keeps a cell-ID index
+(position of every column-major grid ID in the blocks, -1 for no-value
+cells), the dates, and a JSON manifest.
+
+Conversion command:
+    python timeseriesStore.py piscopd_180731_dlee.npz ./data/piscopd_store
+    (--product PISCOpd --version V2.1 takes no-value cells from gridMeta)
+
+    - openNpz(fn)
+    - convertCube(cube, path, dates, tile=16, valid=None, chunk=365)
+    - loadManifest(path)
+    - loadDates(path)
+    - readSeries(path, cells)
+'''
+import os
+import json
+import argparse
+import numpy as np
+import cubeReader as cr
+import gridMeta as gm
+
+MANIFEST = 'manifest.json'
+
+
+def openNpz(fn):
+    '''
+    Returns a cube (as cubeReader.openCube) of a PISCO npz file (prcp, lat,
+    lon, tim) and its dates. The npz array is read once in memory.
+    '''
+    temp = np.load(fn)
+    prcp = temp['prcp']
+    ntim, nlat, nlon = prcp.shape
+    cube = {'fn': fn, 'nc': None, 'data': prcp, 'shape': (nlat, nlon), 'ntim': ntim,
+            'lat': temp['lat'], 'lon': temp['lon'], 'fill': None, 'chunk': 365,
+            'valid': None}
+    return cube, np.asarray(temp['tim'], dtype='datetime64[D]')
+
+
+def _tileOrder(cells, shape, tile):
+    # Cells sorted by tile (row-major tiles), then by cell ID
+    ilat, ilon = cr.cellIndex(cells, shape)
+    ntcol = int(np.ceil(shape[1]/tile))
+    tid = (ilat // tile)*ntcol + (ilon // tile)
+    order = np.lexsort((cells, tid))
+    return cells[order], tid[order]
+
+
+def convertCube(cube, path, dates, tile=16, valid=None, chunk=365):
+    '''
+    Rechunks a cube into the time-contiguous store at path.
+
+    tile  - side (cells) of the square spatial blocks
+    valid - (cells,) boolean vector of cells to store (column-major order);
+            default is the valid cells set on the cube (gridMeta), or cells
+            with any non-negative value
+    chunk - time steps read from the cube at a time
+    '''
+    nlat, nlon = cube['shape']; ntim = cube['ntim']
+    if (valid is None) and (cube.get('valid') is not None):
+        valid = cube['valid'].ravel(order='F')
+    elif valid is None:
+        _, vmax = cr.timeMinMax(cube, chunk)
+        valid = (vmax >= 0)
+    cells, tid = _tileOrder(np.flatnonzero(valid), (nlat, nlon), tile)
+    # Cell-ID index: block of each stored cell and its row in the block
+    bid, start = np.unique(tid, return_index=True)
+    block = np.searchsorted(bid, tid)
+    row = np.arange(len(cells)) - start[block]
+    position = np.full(nlat*nlon, -1, dtype=np.int64)
+    position[cells] = np.arange(len(cells))
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'cells.npy'), cells)
+    np.save(os.path.join(path, 'position.npy'), position)
+    np.save(os.path.join(path, 'block.npy'), block.astype(np.int32))
+    np.save(os.path.join(path, 'row.npy'), row.astype(np.int32))
+    np.save(os.path.join(path, 'dates.npy'), np.asarray(dates, dtype='datetime64[D]'))
+    # Blocks of (cells x time), filled by time chunks
+    nblock = len(bid); bound = np.append(start, len(cells))
+    blocks = [np.lib.format.open_memmap(
+                  os.path.join(path, 'block_%05d.npy' % b), mode='w+',
+                  dtype='float32', shape=(int(bound[b+1] - bound[b]), int(ntim)))
+              for b in range(nblock)]
+    ilat, ilon = cr.cellIndex(cells, (nlat, nlon))
+    for tslice, data in cr.iterChunks(cube, chunk):
+        series = data[:, ilat, ilon].T
+        for b in range(nblock):
+            blocks[b][:, tslice] = series[bound[b]:bound[b+1]]
+        print('{}/{} time steps are rechunked.'.format(tslice.stop, ntim))
+    for b in blocks:
+        b.flush()
+    del blocks
+    manifest = {'shape': [nlat, nlon], 'ntim': int(ntim), 'order': 'F',
+                'tile': int(tile), 'nblock': int(nblock), 'ncell': int(len(cells)),
+                'dtype': 'float32'}
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    print('%s is saved.' % path)
+
+
+def loadManifest(path):
+    '''
+    Returns the manifest of a store
+    '''
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def loadDates(path):
+    '''
+    Returns the dates (datetime64[D]) of a store
+    '''
+    return np.load(os.path.join(path, 'dates.npy'))
+
+
+def readSeries(path, cells):
+    '''
+    Reads the full time series of cells (column-major grid IDs) as a
+    (time x cells) float32 array; only blocks holding the cells are read.
+    No-value cells are NaN.
+    '''
+    cells = np.asarray(cells, dtype=np.int64)
+    manifest = loadManifest(path)
+    position = np.load(os.path.join(path, 'position.npy'), mmap_mode='r')[cells]
+    block = np.load(os.path.join(path, 'block.npy'), mmap_mode='r')
+    row = np.load(os.path.join(path, 'row.npy'), mmap_mode='r')
+    out = np.full((manifest['ntim'], len(cells)), np.nan, dtype='float32')
+    stored = (position >= 0)
+    bcell, rcell = block[position[stored]], row[position[stored]]
+    col = np.flatnonzero(stored)
+    for b in np.unique(bcell):
+        data = np.load(os.path.join(path, 'block_%05d.npy' % b), mmap_mode='r')
+        sel = (bcell == b)
+        out[:, col[sel]] = data[rcell[sel]].T
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rechunks daily PISCO (npz or NetCDF) into a time-contiguous store.')
+    parser.add_argument('source', help='PISCO npz (prcp, lat, lon, tim) or NetCDF file')
+    parser.add_argument('path', help='output store directory')
+    parser.add_argument('--var', default='variable', help='NetCDF variable')
+    parser.add_argument('--start', default='1981-01-01', help='first date of NetCDF')
+    parser.add_argument('--tile', type=int, default=16, help='side of spatial blocks (cells)')
+    parser.add_argument('--product', default=None, help='product of cached grid metadata (e.g., PISCOpd)')
+    parser.add_argument('--version', default=None, help='version of cached grid metadata (e.g., V2.1)')
+    args = parser.parse_args()
+    if (args.product is not None) and (args.version is None):
+        parser.error('--product requires --version')
+    if args.source.endswith('.npz'):
+        cube, dates = openNpz(args.source)
+    else:
+        cube = cr.openCube(args.source, args.var)
+        dates = np.datetime64(args.start) + np.arange(cube['ntim'])
+    if args.product is not None:
+        cr.setValid(cube, gm.gridMeta(cube, args.product, args.version)['valid'])
+    convertCube(cube, args.path, dates, args.tile)
+
+
+if __name__ == "__main__":
+    main()
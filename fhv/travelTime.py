@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+'''
+Flood-aware travel time to health facilities.
+
+Friction (minutes per meter) is built from land cover with a walking speed
+per land-cover class (data/tScenario.xlsx), and cells flooded deeper than a
+threshold are blocked. The grid is compiled into a sparse 8-connected graph
+whose edge costs are the cell-to-cell distances (on the sphere for
+geographic grids) times the mean friction of the two cells, and travel time
+from the nearest facility is solved by one multi-source Dijkstra
+(scipy.sparse.csgraph) from all facility cells. Normal and flooded scenarios
+are independent solves and can be run in a thread pool (one thread per
+scenario). A single graph is not split into tiles or source groups: paths
+cross tile boundaries, and one multi-source solve already settles every cell
+once, whereas solves per source group repeat that work for each group.
+
+    - landCoverSpeed(fn=..., mode='WALKING')
+    - frictionFromLandCover(lcov, speeds)
+    - cellSize(grid)
+    - frictionGraph(friction, grid)
+    - travelTime(friction, grid, sources, blocked=None)
+    - floodTravelTimes(friction, grid, sources, depths, thsd, nproc=1)
+    - additionalTime(normal, flooded, tmax=2000)
+'''
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+from concurrent.futures import ThreadPoolExecutor
+
+# Mean radius of the earth (m)
+EARTH_RADIUS = 6371008.8
+
+
+def landCoverSpeed(fn=os.path.join('data', 'tScenario.xlsx'), mode='WALKING'):
+    '''
+    Returns a dictionary of land-cover class: speed (km/h) of a travel mode
+    from the scenario table (class, label, speed, mode); classes with zero
+    speed (e.g., water bodies) are impassable
+    '''
+    table = pd.read_excel(fn)
+    table = table[(table['mode'] == mode) & (table['speed'] > 0)]
+    return dict(zip(table['class'].astype(int), table['speed'].astype(float)))
+
+
+def frictionFromLandCover(lcov, speeds):
+    '''
+    Returns friction (minutes per meter) of land-cover classes; classes
+    without a speed are impassable (inf)
+    '''
+    friction = np.full(np.shape(lcov), np.inf)
+    for lcls, speed in speeds.items():
+        friction[lcov == lcls] = 60/(speed*1000)
+    return friction
+
+
+def cellSize(grid):
+    '''
+    Returns (dx, dy) cell sizes (m) per row; dx varies with latitude on a
+    geographic grid
+    '''
+    transform, (nrow, ncol) = grid['transform'], grid['shape']
+    if grid['crs'].is_geographic:
+        lat = transform.f + transform.e*(np.arange(nrow) + 0.5)
+        dy = np.full(nrow, np.radians(abs(transform.e))*EARTH_RADIUS)
+        dx = np.radians(abs(transform.a))*EARTH_RADIUS*np.cos(np.radians(lat))
+    else:
+        dx, dy = np.full(nrow, abs(transform.a)), np.full(nrow, abs(transform.e))
+    return dx, dy
+
+
+def frictionGraph(friction, grid):
+    '''
+    Returns an 8-connected (cells x cells) CSR graph of travel times (minutes)
+    between neighboring cells. Edges to impassable cells are dropped.
+    '''
+    nrow, ncol = friction.shape
+    dx, dy = cellSize(grid)
+    cell = np.arange(nrow*ncol).reshape(nrow, ncol)
+    rows, cols, vals = [], [], []
+    # East, south, south-east, and south-west neighbors (undirected)
+    for di, dj in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        i0, i1 = slice(0, nrow-di), slice(di, nrow)
+        j0, j1 = (slice(0, ncol-dj), slice(dj, ncol)) if dj >= 0 else \
+                 (slice(-dj, ncol), slice(0, ncol+dj))
+        dxr = dx[i0] if di == 0 else (dx[i0] + dx[i1])/2
+        dist = np.sqrt((dj*dxr)**2 + (di*dy[i0])**2)[:,None]
+        cost = dist*(friction[i0,j0] + friction[i1,j1])/2
+        ok = np.isfinite(cost)
+        rows.append(cell[i0,j0][ok]); cols.append(cell[i1,j1][ok])
+        vals.append(cost[ok])
+    return sparse.csr_matrix((np.concatenate(vals),
+                              (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(nrow*ncol, nrow*ncol))
+
+
+def travelTime(friction, grid, sources, blocked=None):
+    '''
+    Travel time (minutes) to the nearest source cell.
+
+    sources - flat indices of source (facility) cells
+    blocked - optional boolean array of impassable cells (e.g., flooded);
+              blocked sources are not used
+
+    Unreachable cells are inf.
+    '''
+    if blocked is not None:
+        friction = np.where(blocked, np.inf, friction)
+        sources = sources[~blocked.ravel()[sources]]
+    sources = np.unique(sources[np.isfinite(friction.ravel()[sources])])
+    if len(sources) == 0:
+        return np.full(friction.shape, np.inf)
+    graph = frictionGraph(friction, grid)
+    time = csgraph.dijkstra(graph, directed=False, indices=sources,
+                            min_only=True)
+    return time.reshape(friction.shape)
+
+
+def _floodedTime(friction, grid, sources, depth, thsd):
+    return travelTime(friction, grid, sources, np.asarray(depth) > thsd)
+
+
+def floodTravelTimes(friction, grid, sources, depths, thsd, nproc=1):
+    '''
+    Normal and flooded travel times (minutes) to the nearest facility.
+
+    depths - list of flood depth rasters (scenarios)
+    thsd   - flood depth above which cells are impassable
+    nproc  - number of threads, one scenario per thread (each solve is
+             independent; threads share the friction and depth arrays, and
+             scripts need no __main__ guard); a single solve is not
+             parallelized, so more threads than scenarios do not help
+
+    Returns (normal, [flooded of each depth]).
+    '''
+    if nproc == 1:
+        normal = travelTime(friction, grid, sources)
+        flooded = [_floodedTime(friction, grid, sources, d, thsd) for d in depths]
+        return normal, flooded
+    with ThreadPoolExecutor(max_workers=nproc) as pool:
+        job = pool.submit(travelTime, friction, grid, sources)
+        jobs = [pool.submit(_floodedTime, friction, grid, sources, d, thsd)
+                for d in depths]
+        return job.result(), [j.result() for j in jobs]
+
+
+def additionalTime(normal, flooded, tmax=2000):
+    '''
+    Additional travel time (minutes) due to flood. Cells cut off from all
+    facilities by flood take tmax as their flooded travel time, as in the
+    precomputed BGD travel-time layers.
+    '''
+    flooded = np.where(np.isinf(flooded) & np.isfinite(normal), tmax, flooded)
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isfinite(normal), flooded - normal, np.nan)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+Zonal statistics of value rasters (or vectors) by zone IDs.
+
+Sums, valid counts and weighted sums of any number of values are computed for
+every zone in one pass with np.bincount over the zone codes, instead of
+masking each zone separately. Rasters larger than memory are processed block
+by block and the partial sums are merged. Zone sums can be rolled up to
+parent units (e.g., district -> province -> department of Peru IDDIST).
+
+    - zonalSums(zone, values, weights=None, nodata=None)
+    - zonalStats(zone, values, weights=None, nodata=None)
+    - zonalStatsRaster(zone_fn, value_fns, weight_fn=None, nrow=None)
+    - aggregateZones(table, divisor)
+'''
+import numpy as np
+import pandas as pd
+import rasterIO as rio
+
+
+def zonalSums(zone, values, weights=None, nodata=None):
+    '''
+    Returns a DataFrame (index: zone ID) of additive statistics:
+    count (cells), <name>_sum and <name>_n (valid, non-NaN cells), and
+    <name>_wsum and <name>_w (sum of weights of valid cells) if weights given.
+
+    zone    - array of integer zone IDs
+    values  - dictionary of name: array (same shape as zone)
+    weights - optional array of weights (e.g., population)
+    nodata  - zone ID to be excluded
+    '''
+    zone = np.ravel(zone)
+    valid = np.ones(zone.shape, dtype=bool) if nodata is None else (zone != nodata)
+    ids, code = np.unique(zone[valid], return_inverse=True)
+    nzone = len(ids)
+    table = {'count': np.bincount(code, minlength=nzone)}
+    if weights is not None:
+        wght = np.ravel(weights)[valid].astype('float64')
+    for name, value in values.items():
+        value = np.ravel(value)[valid].astype('float64')
+        ok = ~np.isnan(value)
+        table[name+'_sum'] = np.bincount(code[ok], value[ok], minlength=nzone)
+        table[name+'_n'] = np.bincount(code[ok], minlength=nzone)
+        if weights is not None:
+            table[name+'_wsum'] = np.bincount(code[ok], value[ok]*wght[ok],
+                                              minlength=nzone)
+            table[name+'_w'] = np.bincount(code[ok], wght[ok], minlength=nzone)
+    return pd.DataFrame(table, index=pd.Index(ids, name='zone'))
+
+
+def finalize(table):
+    '''
+    Adds means (<name>_mean) and weighted means (<name>_wmean) to a table of
+    zonal sums
+    '''
+    table = table.copy()
+    for col in [c for c in table.columns if c.endswith('_sum')]:
+        name = col[:-4]
+        table[name+'_mean'] = table[col]/table[name+'_n'].replace(0, np.nan)
+        if name+'_wsum' in table:
+            table[name+'_wmean'] = table[name+'_wsum']/table[name+'_w'].replace(0, np.nan)
+    return table
+
+
+def zonalStats(zone, values, weights=None, nodata=None):
+    '''
+    Returns a DataFrame of zonal sums, counts, means and weighted means
+    '''
+    return finalize(zonalSums(zone, values, weights, nodata))
+
+
+def zonalStatsRaster(zone_fn, value_fns, weight_fn=None, nrow=None):
+    '''
+    Zonal statistics of rasters on the same grid, read block by block.
+
+    zone_fn   - raster of zone IDs (its NoData is excluded)
+    value_fns - dictionary of name: raster filename
+    weight_fn - optional raster of weights
+    '''
+    nodata = rio.readMeta(zone_fn)['nodata']
+    parts = []
+    for window, zone in rio.iterWindows(zone_fn, nrow=nrow):
+        values = {name: rio.readRaster(fn, window=window, dtype='float64',
+                                       nodata=np.nan)
+                  for name, fn in value_fns.items()}
+        weights = None
+        if weight_fn is not None:
+            weights = rio.readRaster(weight_fn, window=window, dtype='float64',
+                                     nodata=0)
+        parts.append(zonalSums(zone, values, weights, nodata))
+    table = pd.concat(parts).groupby(level=0).sum()
+    return finalize(table)
+
+
+def aggregateZones(table, divisor):
+    '''
+    Rolls zonal sums up to parent units whose IDs are zone ID // divisor
+    (e.g., Peru IDDIST // 100 for provinces, // 10000 for departments)
+    '''
+    sums = table[[c for c in table.columns
+                  if not c.endswith('_mean') and not c.endswith('_wmean')]]
+    parent = sums.groupby(sums.index // divisor).sum()
+    parent.index.name = 'zone'
+    return finalize(parent)